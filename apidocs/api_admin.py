@@ -0,0 +1,87 @@
+""" APIDocs for /api/admin/cache """
+
+
+class APIAdmin:  # pylint: disable=too-few-public-methods
+    """flasgger definition for /api/admin/cache"""
+
+    api_cache_stats = {
+        "tags": ["Admin"],
+        "summary": "Memoization cache metrics",
+        "parameters": [
+            {
+                "name": "Authorization",
+                "in": "header",
+                "type": "string",
+                "required": True,
+                "description": "Authentication token",
+            },
+        ],
+        "responses": {
+            "200": {
+                "description": "Successful response",
+                "content": {
+                    "application/json": {
+                        "example": {
+                            "hits": 90,
+                            "stale_hits": 0,
+                            "misses": 10,
+                            "expirations": 2,
+                            "coalesced": 0,
+                            "refreshes": 0,
+                            "rejections": 0,
+                            "computations": 10,
+                            "compute_time": 0.5,
+                            "compressions": 0,
+                            "decompressions": 0,
+                            "raw_bytes": 0,
+                            "compressed_bytes": 0,
+                            "encode_time": 0.0,
+                            "decode_time": 0.0,
+                            "time_saved": 4.5,
+                            "hit_ratio": 0.9,
+                            "evictions": 0,
+                            "usage": {
+                                "items": 8,
+                                "max_items": 300,
+                                "bytes": 52000,
+                                "max_bytes": 67108864,
+                            },
+                            "functions": {
+                                "routes.api_search_task.handle_search_request": {
+                                    "hits": 90,
+                                    "stale_hits": 0,
+                                    "misses": 10,
+                                    "expirations": 2,
+                                    "coalesced": 0,
+                                    "refreshes": 0,
+                                    "rejections": 0,
+                                    "computations": 10,
+                                    "compute_time": 0.5,
+                                    "compressions": 0,
+                                    "decompressions": 0,
+                                    "raw_bytes": 0,
+                                    "compressed_bytes": 0,
+                                    "encode_time": 0.0,
+                                    "decode_time": 0.0,
+                                    "time_saved": 4.5,
+                                    "hit_ratio": 0.9,
+                                }
+                            },
+                        }
+                    }
+                },
+            },
+            "400": {
+                "description": "Bad Request",
+                "content": {
+                    "application/json": {
+                        "example": {"error": "Authorization header missing"}
+                    }
+                },
+            },
+            "403": {
+                "description": "Forbidden",
+                "content": {"application/json": {"example": {"error": "Forbidden"}}},
+            },
+        },
+    }
@@ -35,6 +35,13 @@ class APITaskCRUD:
                 "schema": {"type": "int"},
                 "description": "Number of tasks per page",
             },
+            {
+                "name": "cursor",
+                "in": "query",
+                "schema": {"type": "string"},
+                "description": "Paginate by cursor instead of page: empty for the first page, "
+                "next_cursor of the former page for the next page",
+            },
         ],
         "responses": {
             "200": {
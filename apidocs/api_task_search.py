@@ -1,8 +1,8 @@
-""" APIDocs for /api/task/search """
+""" APIDocs for /api/task/search and /api/task/suggest """
 
 
 class APITaskSearch:  # pylint: disable=too-few-public-methods
-    """flasgger definition for /api/task/search"""
+    """flasgger definitions for /api/task/search and /api/task/suggest"""
 
     api_search_task = {
         "tags": ["Task: Search"],
@@ -27,6 +27,13 @@ class APITaskSearch:  # pylint: disable=too-few-public-methods
                 "schema": {"type": "int"},
                 "description": "Number of tasks per page",
             },
+            {
+                "name": "cursor",
+                "in": "query",
+                "schema": {"type": "string"},
+                "description": "Paginate by cursor instead of page: empty for the first page, "
+                "next_cursor of the former page for the next page",
+            },
             {
                 "name": "status",
                 "in": "query",
@@ -108,3 +115,58 @@ class APITaskSearch:  # pylint: disable=too-few-public-methods
             },
         },
     }
+
+    api_suggest_task = {
+        "tags": ["Task: Search"],
+        "summary": "Suggest task titles starting with a prefix (autocomplete)",
+        "parameters": [
+            {
+                "name": "Authorization",
+                "in": "header",
+                "type": "string",
+                "required": True,
+                "description": "Authentication token",
+            },
+            {
+                "name": "prefix",
+                "in": "query",
+                "required": True,
+                "schema": {"type": "string"},
+                "description": "Prefix of the titles (case-insensitive)",
+            },
+            {
+                "name": "limit",
+                "in": "query",
+                "schema": {"type": "int"},
+                "description": "Maximum number of suggestions (1 to 100, default 10)",
+            },
+        ],
+        "responses": {
+            "200": {
+                "description": "Successful response",
+                "content": {
+                    "application/json": {
+                        "example": {"result": ["Task 1", "Task 2"]}
+                    }
+                },
+            },
+            "400": {
+                "description": "Bad Request",
+                "content": {
+                    "application/json": {
+                        "example": {"error": "Missing prefix. Please provide a prefix."}
+                    }
+                },
+            },
+            "403": {
+                "description": "Forbidden",
+                "content": {"application/json": {"example": {"error": "Forbidden"}}},
+            },
+            "500": {
+                "description": "Internal Server Error",
+                "content": {
+                    "application/json": {"example": {"error": "Internal Server Error"}}
+                },
+            },
+        },
+    }
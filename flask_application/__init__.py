@@ -1,11 +1,16 @@
 """ __init__ file"""
-from flask import Flask, g, request
+import os
+from flask import Flask, g, request, current_app
 from flask_authorize import Authorize
-
-# from itsdangerous import TimedJSONWebSignatureSerializer as Serializer, BadSignature, SignatureExpired
-from itsdangerous.url_safe import URLSafeTimedSerializer as Serializer, BadPayload
-from models.users_model import User
+from models.task_model import Task
+from generic_helpers.authenticator import Authenticator
 from generic_helpers.memoize import Memoize
+from generic_helpers.memoize_backends import MemoryBackend, SQLiteBackend, TieredBackend
+from generic_helpers.memoize_codecs import ZlibCodec
+from generic_helpers.frequency_sketch import FrequencySketch
+from generic_helpers.search_index import SearchIndex, register_search_index
+from generic_helpers.row_store import RowStore
+from generic_helpers.levenshtein import iter_by_ids
 
 
 # Create the Flask app
@@ -22,29 +27,109 @@ def my_current_user():
     if token is None:
         return None
 
-    # Verify and extract user from the token
-    user = extract_user_from_token(token)
-    return user
-
-
-def extract_user_from_token(token):
-    """
-    Extract user from the token.
-    """
-    serializer = Serializer(app.config["SECRET_KEY"])
-    try:
-        data = serializer.loads(token)
-        user_id = data.get("id")
-        # Assuming you have a User model with an 'id' field
-        user = User.query.get(user_id)
-        return user
-    except BadPayload:
-        return None
+    # Verify and extract user from the token, once per request. The token itself was
+    # most likely decoded by @authenticated already (see: authenticator.py)
+    if "current_user" not in g:
+        g.current_user = Authenticator.get_user_from_token(token)
+    return g.current_user
 
 
 # Initialize authorize decorator, using the declarative method for setting up the extension
 authorize = Authorize(current_user=my_current_user)
 authorize.init_app(app)
 
-# Initialize memoization
-memoize = Memoize(ttl=300, max_items=300)
+# Initialize memoization, bounded by the amount of items and their approximate size in bytes
+# (default 64 MiB), a single memoized search can hold many thousands of tasks
+MEMOIZE_MAX_BYTES = int(os.getenv("MEMOIZE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Memoization backend: 'memory' (default, per process), 'sqlite' (shared by all server
+# processes on this host using the same MEMOIZE_PATH, including their invalidations) or 'tiered'
+# (memory in front of the 'sqlite' backend, which survives restarts and holds MEMOIZE_L2_MAX_ITEMS)
+MEMOIZE_BACKEND = os.getenv("MEMOIZE_BACKEND", "memory")
+
+# Version of the memoized values, increment it when what they hold changes (e.g. task ids instead of
+# serialized tasks, or searches holding the due_date sort values as well). The SQLite file is per
+# version, after a deploy the new code doesn't unpickle the items stored by the old one
+MEMOIZE_FORMAT = 3
+
+
+def versioned_path(path, version):
+    """Return the path with the version before its extension, e.g. memoize.v2.db"""
+    root, extension = os.path.splitext(path)
+    return f"{root}.v{version}{extension}"
+
+
+MEMOIZE_PATH = versioned_path(
+    os.getenv("MEMOIZE_PATH", os.path.join(os.getcwd(), "memoize.db")), MEMOIZE_FORMAT
+)
+MEMOIZE_L2_MAX_ITEMS = int(os.getenv("MEMOIZE_L2_MAX_ITEMS", "10000"))
+MEMOIZE_L2_MAX_BYTES = int(os.getenv("MEMOIZE_L2_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def create_memoize_backend():
+    """Create the memoization backend configured by MEMOIZE_BACKEND, None for the default"""
+    if MEMOIZE_BACKEND == "sqlite":
+        return SQLiteBackend(MEMOIZE_PATH, max_items=300, max_bytes=MEMOIZE_MAX_BYTES)
+    if MEMOIZE_BACKEND == "tiered":
+        return TieredBackend(
+            MemoryBackend(max_items=300, max_bytes=MEMOIZE_MAX_BYTES),
+            SQLiteBackend(
+                MEMOIZE_PATH,
+                max_items=MEMOIZE_L2_MAX_ITEMS,
+                max_bytes=MEMOIZE_L2_MAX_BYTES,
+            ),
+        )
+    return None
+
+
+# Once the cache is full, a new result only replaces the least recently used one when its key is
+# requested more often (TinyLFU), so a long tail of one-off searches doesn't flush the popular ones.
+# Disable by setting MEMOIZE_ADMISSION to 'all'.
+MEMOIZE_ADMISSION = os.getenv("MEMOIZE_ADMISSION", "tinylfu")
+
+# Results which pickle to at least MEMOIZE_COMPRESS_THRESHOLD bytes are stored compressed, more of
+# them fit in MEMOIZE_MAX_BYTES at the cost of decompressing them on every hit. Disabled when 0.
+MEMOIZE_COMPRESS_THRESHOLD = int(os.getenv("MEMOIZE_COMPRESS_THRESHOLD", "0"))
+memoize = Memoize(
+    ttl=300,
+    max_items=300,
+    max_bytes=MEMOIZE_MAX_BYTES,
+    backend=create_memoize_backend(),
+    admission=FrequencySketch(width=16 * 300) if MEMOIZE_ADMISSION == "tinylfu" else None,
+    codec=ZlibCodec(threshold=MEMOIZE_COMPRESS_THRESHOLD) if MEMOIZE_COMPRESS_THRESHOLD > 0 else None,
+)
+
+# Memoized responses are served stale for this many seconds after their ttl, while they are
+# refreshed in the background (see: Memoize, stale-while-revalidate)
+MEMOIZE_STALE_TTL = int(os.getenv("MEMOIZE_STALE_TTL", "60"))
+
+
+def memoize_context():
+    """Return an application context of the current app, the memoized functions which are
+    refreshed in the background (they use the database) run within it
+    """
+    return current_app._get_current_object().app_context()  # pylint: disable=protected-access
+
+
+# Initialize the search index of the task titles, holding status and due_date for filtering and sorting.
+# The writes of other processes are read from the change log of the tasks table (see: SearchIndex)
+search_index = register_search_index(
+    SearchIndex(Task, "title", attributes=("status", "due_date"))
+)
+
+
+def load_task_rows(ids):
+    """Load the serialized tasks of the ids from the database, returns a dict id -> row"""
+    return {task.id: task.serialize() for task in iter_by_ids(Task, ids)}
+
+
+# The memoized pages and searches hold the ids of their tasks, the serialized tasks are stored once
+# in this store (up to TASK_ROWS_MAX_ITEMS) and looked up when a response is built. It's cleared
+# when another process invalidates memoized results, and a row expires with the memoize ttl (see: RowStore)
+TASK_ROWS_MAX_ITEMS = int(os.getenv("TASK_ROWS_MAX_ITEMS", "100000"))
+task_rows = RowStore(
+    load_task_rows,
+    generation=memoize.backend.generation,
+    max_items=TASK_ROWS_MAX_ITEMS,
+    ttl=memoize.ttl,
+)
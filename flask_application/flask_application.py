@@ -7,11 +7,32 @@ from flasgger import Swagger
 from routes import doc, api, auth
 from database import db
 from models.users_model import Group
-from flask_application import app
+from models.task_model import Task
+from generic_helpers.fts_search import create_fts_index
+from generic_helpers.levenshtein import WORKER_STRATEGIES, THRESHOLD
+from flask_application import app, search_index
 
 
 DATABASE_URI = f"sqlite:///{os.path.join(os.getcwd(), 'tasks.db')}"
 
+# Search backend for /api/task/search: 'levenshtein' (default) or 'fts5' (SQLite full-text index)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "levenshtein")
+
+# Strategy of the levenshtein backend: 'trigram' (default), 'bktree', 'batch', 'parallel' or 'scan'
+SEARCH_STRATEGY = os.getenv("SEARCH_STRATEGY", "trigram")
+
+# Levenshtein distance a title must stay below to match the query. Tighten it (e.g. 3) to make the
+# 'bktree' strategy prune: at the default it compares nearly every title
+SEARCH_THRESHOLD = int(os.getenv("SEARCH_THRESHOLD", str(THRESHOLD)))
+
+# Amount of worker processes the scoring of the 'parallel' strategy is split over
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", str(os.cpu_count() or 1)))
+
+
+def parse_bool(value):
+    """Parse the value of a boolean environment variable, e.g. '1', 'true', 'yes' or 'on' (case-insensitive)"""
+    return value is not None and value.strip().lower() in ("1", "true", "yes", "on")
+
 
 # Swagger template
 template = {
@@ -59,6 +80,17 @@ class APIServer:
         self.app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+        # Configure search. With the 'fts5' backend the description can be searched as well,
+        # and the amount of (ranked) results can be limited
+        self.app.config["SEARCH_BACKEND"] = SEARCH_BACKEND
+        self.app.config["SEARCH_STRATEGY"] = SEARCH_STRATEGY
+        self.app.config["SEARCH_WORKERS"] = SEARCH_WORKERS
+        self.app.config["SEARCH_THRESHOLD"] = SEARCH_THRESHOLD
+        self.app.config["SEARCH_FTS_DESCRIPTION"] = parse_bool(os.getenv("SEARCH_FTS_DESCRIPTION"))
+        self.app.config["SEARCH_FTS_LIMIT"] = (
+            int(os.getenv("SEARCH_FTS_LIMIT")) if os.getenv("SEARCH_FTS_LIMIT") else None
+        )
+
         # Swagger
         self.app.config["SWAGGER"] = {
             "title": "Assessment Backend Developer",
@@ -85,6 +117,21 @@ class APIServer:
             db.create_all()
             self.create_users_group()
 
+            # The full-text index isn't part of the models, create it (and its triggers) by hand
+            if self.app.config["SEARCH_BACKEND"] == "fts5":
+                create_fts_index(Task, ["title", "description"])
+
+            # Build the search index at startup, instead of on the first search
+            search_index.build()
+            strategy = self.app.config["SEARCH_STRATEGY"]
+            if strategy in WORKER_STRATEGIES:
+                search_index.get_index(strategy, workers=self.app.config["SEARCH_WORKERS"])
+            elif strategy != "scan":
+                search_index.get_index(strategy)
+
+            # The prefix index serves the autocompletion (/api/task/suggest)
+            search_index.get_index("prefix")
+
     def run(self):
         """Start API server"""
 
@@ -93,6 +140,8 @@ class APIServer:
         print(f"API: http://{self.ip}:{self.port}/api/task")
         print(f"API: http://{self.ip}:{self.port}/api/task/<id>")
         print(f"API: http://{self.ip}:{self.port}/api/task/search")
+        print(f"API: http://{self.ip}:{self.port}/api/task/suggest")
+        print(f"API: http://{self.ip}:{self.port}/api/admin/cache")
 
         # Setup Flask configuration parameters
         self.config()
@@ -1,5 +1,12 @@
-""" Authentication class """
-from functools import wraps
+""" Authentication class
+
+    A token is decoded (its signature verified) at most once per request, the result is kept in
+    flask.g for the rest of the request (e.g. for the current user of flask_authorize). A verified
+    token is remembered (token -> user id) for TOKEN_CACHE_TTL seconds, the next requests with the
+    same token don't verify its signature again. Invalid tokens are not remembered.
+"""
+import threading
+from functools import wraps, lru_cache
 from http import HTTPStatus
 
 # from itsdangerous import (
@@ -9,9 +16,62 @@ from http import HTTPStatus
 # )
 from itsdangerous.url_safe import URLSafeTimedSerializer as Serializer
 from itsdangerous.exc import BadTimeSignature, BadSignature, BadPayload
-from flask import current_app, request, make_response, jsonify
+from flask import current_app, request, make_response, jsonify, g
 from flask_bcrypt import Bcrypt
 from models.users_model import User
+from database import db
+from generic_helpers.memoize_backends import MemoryBackend, HIT
+
+# Verified tokens are remembered for this many seconds, at most TOKEN_CACHE_MAX_ITEMS of them
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_MAX_ITEMS = 1024
+_verified_tokens = MemoryBackend(max_items=TOKEN_CACHE_MAX_ITEMS)
+_verified_tokens_lock = threading.Lock()
+
+
+@lru_cache(maxsize=8)
+def get_serializer(secret_key):
+    """Return the serializer of a secret key, one per key (it derives its signing key once)"""
+    return Serializer(secret_key)
+
+
+def decode_token(token):
+    """Return a tuple (valid, user id) of a token, the user id is None if the token doesn't hold one
+
+    The token is decoded once per request, and a verified token is remembered for a while (see: module)
+    """
+
+    # Decoded before during this request
+    decoded = g.get("decoded_token")
+    if decoded is not None and decoded[0] == token:
+        return decoded[1:]
+
+    # Verified before by a former request, the key holds the secret key: it might have been changed
+    secret_key = current_app.config["SECRET_KEY"]
+    with _verified_tokens_lock:
+        status, user_id = _verified_tokens.get((secret_key, token))
+    valid = status == HIT
+
+    if not valid:
+        try:
+            data = get_serializer(secret_key).loads(token)
+        except (BadTimeSignature, BadSignature, BadPayload):
+            # valid token (but expired), invalid token or generic exception
+            user_id = None
+        else:
+            valid = True
+            user_id = data.get("id") if isinstance(data, dict) else None
+            with _verified_tokens_lock:
+                _verified_tokens.set((secret_key, token), user_id, TOKEN_CACHE_TTL)
+
+    g.decoded_token = (token, valid, user_id)
+    return valid, user_id
+
+
+def clear_verified_tokens():
+    """Forget the verified tokens, e.g. after the secret key has been rotated"""
+    with _verified_tokens_lock:
+        _verified_tokens.clear()
 
 
 class Authenticator:
@@ -41,7 +101,7 @@ class Authenticator:
             raise ValueError("Invalid password")
 
         # Create new token and get the dump the json object into token
-        serializer = Serializer(current_app.config["SECRET_KEY"])
+        serializer = get_serializer(current_app.config["SECRET_KEY"])
         token = serializer.dumps({"id": self.user_obj.id})
 
         # return the token
@@ -50,32 +110,16 @@ class Authenticator:
     @staticmethod
     def verify_token(token):
         """Verify token"""
-
-        # Create an instance of Serializer for token validation
-        serializer = Serializer(current_app.config["SECRET_KEY"])
-        try:
-            serializer.loads(token)
-        except (BadTimeSignature, BadSignature, BadPayload):
-            return (
-                False  # valid token (but expired), invalid token or generic exception
-            )
-        return True
+        valid, _ = decode_token(token)
+        return valid
 
     @staticmethod
     def get_user_from_token(token):
         """Extract user ID from token"""
-
-        # Setup serializer
-        serializer = Serializer(current_app.config["SECRET_KEY"])
-        try:
-            data = serializer.loads(token)
-            user_id = data.get("id")
-            if user_id is None:
-                return None
-            user = User.query.get(user_id)
-            return user
-        except (BadTimeSignature, BadSignature, BadPayload):
-            return None  # Invalid token or token expired
+        _, user_id = decode_token(token)
+        if user_id is None:
+            return None  # Invalid token, token expired or no user ID
+        return db.session.get(User, user_id)
 
 
 def authenticated(func):
@@ -0,0 +1,146 @@
+""" BK-tree: a metric space index for levenshtein distance queries
+
+    see: https://en.wikipedia.org/wiki/BK-tree
+
+    Every node holds a value, and its children are stored by their distance to that value. Because the
+    levenshtein distance obeys the triangle inequality, a query within 'max_distance' of a node at
+    distance 'd' can only be found in the children at distance d - max_distance .. d + max_distance.
+    All other subtrees are skipped, the tighter the max_distance the less values are compared.
+"""
+import threading
+from Levenshtein import distance
+from generic_helpers.trigram_index import normalize
+
+# The tree is rebuilt when more than this fraction of its nodes doesn't hold any key
+MAX_EMPTY_FRACTION = 0.5
+
+
+class BKTreeNode:  # pylint: disable=too-few-public-methods
+    """ A node of the BK-tree: a (normalized) value, the keys holding this value and the children """
+
+    def __init__(self, value):
+        self.value = value
+        self.keys = set()
+        self.children = {}
+
+
+class BKTree:
+    """ BK-tree from (normalized) value to keys
+
+    Example usage:
+
+    tree = BKTree()
+    tree.add(1, 'Task 1')
+    tree.add(2, 'Groceries')
+    tree.search('task 2', max_distance=1)  # -> [(1, 'task 1', 1)]
+
+    Removed keys leave their node in place (without keys), the node is still needed to reach its
+    children. Once more than MAX_EMPTY_FRACTION of the nodes is empty, the tree is rebuilt from the
+    values, so renames and deletes don't grow it without bound. The tree is safe to use from
+    multiple (wsgiserver) threads.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.values = {}
+        self.nodes = 0
+        self.empty_nodes = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def _find_node(self, value, create=False):
+        """ Walk the tree to the node holding value, optionally create it when it doesn't exist """
+        if self.root is None:
+            if not create:
+                return None
+            self.root = BKTreeNode(value)
+            self.nodes += 1
+            return self.root
+
+        node = self.root
+        while True:
+            node_distance = distance(value, node.value)
+            if node_distance == 0:
+                return node
+            child = node.children.get(node_distance)
+            if child is None:
+                if not create:
+                    return None
+                child = BKTreeNode(value)
+                node.children[node_distance] = child
+                self.nodes += 1
+                return child
+            node = child
+
+    def add(self, key, value):
+        """ Add (or replace) the value stored under key """
+        normalized = normalize(value)
+        with self.lock:
+            self.remove(key)
+            self.values[key] = normalized
+            self._add_key(key, normalized)
+
+    def _add_key(self, key, normalized):
+        """ Add a key to the node holding the normalized value """
+        nodes = self.nodes
+        node = self._find_node(normalized, create=True)
+
+        # An empty node which holds a key again (a node which was just created wasn't counted)
+        if not node.keys and self.nodes == nodes:
+            self.empty_nodes -= 1
+        node.keys.add(key)
+
+    def remove(self, key):
+        """ Remove a key from the tree, silently ignore unknown keys """
+        with self.lock:
+            normalized = self.values.pop(key, None)
+            if normalized is None:
+                return
+            node = self._find_node(normalized)
+            if node is None:
+                return
+            node.keys.discard(key)
+            if not node.keys:
+                self.empty_nodes += 1
+                if self.empty_nodes > self.nodes * MAX_EMPTY_FRACTION:
+                    self._rebuild()
+
+    def _rebuild(self):
+        """ Build the tree again from the values, without the empty nodes """
+        values = self.values
+        self.clear()
+        self.values = values
+        for key, normalized in values.items():
+            self._add_key(key, normalized)
+
+    def clear(self):
+        """ Remove everything from the tree """
+        with self.lock:
+            self.root = None
+            self.values = {}
+            self.nodes = 0
+            self.empty_nodes = 0
+
+    def search(self, query, max_distance):
+        """ Return a list of (key, normalized value, distance) tuples within max_distance of the query """
+        normalized_query = normalize(query)
+        results = []
+        with self.lock:
+            if self.root is None:
+                return results
+
+            nodes = [self.root]
+            while nodes:
+                node = nodes.pop()
+                node_distance = distance(normalized_query, node.value)
+                if node_distance <= max_distance:
+                    results.extend((key, node.value, node_distance) for key in node.keys)
+
+                # Triangle inequality: only these children can be within max_distance of the query
+                nodes.extend(
+                    child for child_distance, child in node.children.items()
+                    if node_distance - max_distance <= child_distance <= node_distance + max_distance
+                )
+        return results
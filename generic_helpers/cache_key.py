@@ -0,0 +1,37 @@
+""" Build memoization keys from the parameters of a request
+
+    A key holds what determines the result: the namespace (which endpoint), the visibility scope (which
+    data the user may see) and the normalized parameters. It doesn't hold who is asking, so users who
+    see the same data share one cache entry, and a new login token doesn't start with a cold cache.
+
+    Example usage:
+
+    build_cache_key('task_search', title='Task', status='pending', limit=20)
+    # -> 'task_search:public:limit=20&status=pending&title=task'
+"""
+from datetime import datetime
+from urllib.parse import urlencode
+
+# Tasks are not owned by a user, everybody sees all of them
+PUBLIC_SCOPE = 'public'
+
+
+def normalize_cache_value(value):
+    """ Normalize a parameter value: strings are lowercased and datetimes are written in iso format """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).lower()
+
+
+def build_cache_key(namespace, scope=PUBLIC_SCOPE, **params):
+    """ Build a memoization key from the namespace, the visibility scope and the parameters
+
+        Parameters which are None are left out and the others are sorted on name, so the key doesn't
+        depend on the order they are passed in. String values are lowercased, only pass parameters
+        which are case-insensitive (e.g. a title search). The parameters are url-encoded, a value
+        can't be mistaken for a separator.
+    """
+    encoded_params = urlencode(
+        sorted((name, normalize_cache_value(value)) for name, value in params.items() if value is not None)
+    )
+    return f'{namespace}:{scope}:{encoded_params}'
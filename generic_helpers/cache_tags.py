@@ -0,0 +1,74 @@
+""" Tags of memoized results, to invalidate only the results a write can affect
+
+    A memoized result is tagged with what it depends on:
+
+    - a query result with its filters: equal values, ranges (exclusive bounds) and a text searched
+      for (case-insensitive) in some fields, e.g. tag_query(equals={'status': TaskStatus.PENDING},
+      contains=('task', ('title',)))
+    - a page of items with the ids on the page, e.g. tag_ids([1, 2, 3])
+
+    A write takes a snapshot of the row before and after the change (None when it's created or
+    deleted), and invalidates the results affected by it:
+
+    memoize.invalidate(affected_by(old_row, new_row))
+
+    A query result is affected when the old or the new row passes its filters, the row was (or is now)
+    part of the result. The tests are a necessary condition only: a text search may have extra
+    rules (e.g. a maximum distance), a result which is invalidated for nothing is just computed again.
+    A page is affected when one of its rows changes, or when a row is created or deleted (all rows
+    after it shift, and the number of pages might change).
+"""
+
+
+def snapshot(item, field_names):
+    """ Return a dict of the id and the fields of an item, the values at this moment """
+    values = {name: getattr(item, name) for name in field_names}
+    values['id'] = item.id
+    return values
+
+
+def tag_query(equals=None, ranges=None, contains=None):
+    """ Tags of a query result: equals {field: value}, ranges {field: (after, before)} and
+        contains (text, fields)
+    """
+    return {'equals': equals or {}, 'ranges': ranges or {}, 'contains': contains}
+
+
+def tag_ids(ids):
+    """ Tags of a page of items """
+    return {'ids': frozenset(ids)}
+
+
+def row_matches(tags, row):
+    """ Check if a row passes the filters of a query result (see: tag_query) """
+    for name, value in tags['equals'].items():
+        if row.get(name) != value:
+            return False
+
+    for name, (after, before) in tags['ranges'].items():
+        # Just like SQL, a missing value is never within a range
+        if row.get(name) is None or not after < row[name] < before:
+            return False
+
+    if tags['contains'] is not None:
+        text, field_names = tags['contains']
+        text = text.lower()
+        if not any(text in (row.get(name) or '').lower() for name in field_names):
+            return False
+    return True
+
+
+def affected_by(old_row, new_row):
+    """ Return a function which checks if the tags of a result are affected by a write (see: module) """
+
+    def affected(tags):
+        # A page of items
+        if 'ids' in tags:
+            if old_row is None or new_row is None:
+                return True
+            return old_row['id'] in tags['ids']
+
+        # A query result
+        return any(row is not None and row_matches(tags, row) for row in (old_row, new_row))
+
+    return affected
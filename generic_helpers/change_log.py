@@ -0,0 +1,61 @@
+""" Log of the changed items of a model, written by SQLite triggers
+
+    Triggers on the model's table append the id of every inserted, updated and deleted item to a log
+    table, in the transaction of the write, regardless if the change is made by this process or by
+    anything else (just like the triggers of the FTS5 index, see: fts_search.py). A reader remembers
+    the last change it has seen, and only reads the changes after it:
+
+    last_change = read_last_change(Task)
+    ...
+    changes = read_changes(Task, last_change)  # -> [(change id, task id), ...]
+
+    The log keeps the last CHANGE_LOG_SIZE changes. A reader which fell further behind misses changes,
+    read_changes tells it by the first change it returns not being the one right after last_change.
+"""
+from sqlalchemy import text
+from database import db
+
+# Amount of changes kept in the log, older ones are deleted by the triggers
+CHANGE_LOG_SIZE = 10000
+
+
+def change_log_table_name(model):
+    """ Name of the change log table for a model """
+    return f'{model.__tablename__}_changes'
+
+
+def create_change_log(model):
+    """ Create the change log table and its triggers for model (if they don't exist yet) """
+    table_name = model.__tablename__
+    log_table = change_log_table_name(model)
+
+    # AUTOINCREMENT, so the id of a trimmed change is never used again
+    trim = f"DELETE FROM {log_table} WHERE id <= (SELECT MAX(id) FROM {log_table}) - {CHANGE_LOG_SIZE};"
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {log_table} (id INTEGER PRIMARY KEY AUTOINCREMENT, item_id INTEGER NOT NULL)",
+        f"CREATE TRIGGER IF NOT EXISTS {log_table}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {log_table}(item_id) VALUES (new.id); {trim} END",
+        f"CREATE TRIGGER IF NOT EXISTS {log_table}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {log_table}(item_id) VALUES (old.id); {trim} END",
+        f"CREATE TRIGGER IF NOT EXISTS {log_table}_au AFTER UPDATE ON {table_name} BEGIN "
+        f"INSERT INTO {log_table}(item_id) VALUES (new.id); "
+        f"INSERT INTO {log_table}(item_id) SELECT old.id WHERE old.id <> new.id; {trim} END",
+    ]
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def read_last_change(model):
+    """ Return the id of the last change of model, 0 if there are none """
+    return db.session.execute(text(f'SELECT MAX(id) FROM {change_log_table_name(model)}')).scalar() or 0
+
+
+def read_changes(model, last_change):
+    """ Return a list of (change id, item id) tuples of the changes of model after last_change, in order """
+    return [
+        tuple(row) for row in db.session.execute(
+            text(f'SELECT id, item_id FROM {change_log_table_name(model)} WHERE id > :last_change ORDER BY id'),
+            {'last_change': last_change}
+        ).all()
+    ]
@@ -0,0 +1,68 @@
+""" Count-min sketch of access frequencies, with aging (as used by the TinyLFU admission policy)
+
+    see: https://en.wikipedia.org/wiki/Count%E2%80%93min_sketch
+    see: https://arxiv.org/abs/1512.00727 (TinyLFU: A Highly Efficient Cache Admission Policy)
+
+    The sketch estimates how often a key was accessed in a fixed amount of memory, no matter how many
+    distinct keys there are: every key increments one small counter in each of 'depth' rows, the
+    estimate is the smallest of its counters (the other keys sharing a counter only add to it). The
+    counters saturate at 15, and every 'sample_size' increments all counters are halved, so the
+    estimates follow the recent popularity instead of the popularity since startup.
+"""
+import threading
+
+MAX_COUNT = 15
+
+
+class FrequencySketch:
+    """ Estimate the (recent) access frequency of keys
+
+    Example usage:
+
+    sketch = FrequencySketch(width=1024)
+    sketch.increment('task')
+    sketch.increment('task')
+    sketch.estimate('task')  # -> 2
+    sketch.estimate('groceries')  # -> 0 (most likely)
+
+    The sketch is safe to use from multiple (wsgiserver) threads.
+    """
+
+    def __init__(self, width=1024, depth=4, sample_size=None):
+        # A power of two, so a hash is mapped on a counter with a mask
+        self.width = 1 << max(0, width - 1).bit_length()
+        self.mask = self.width - 1
+        self.rows = [bytearray(self.width) for _ in range(depth)]
+        self.sample_size = sample_size if sample_size is not None else 10 * self.width
+        self.additions = 0
+        self.lock = threading.Lock()
+
+    def _indexes(self, key):
+        """ Return the index of the key's counter in every row """
+        return [hash((row, key)) & self.mask for row in range(len(self.rows))]
+
+    def increment(self, key):
+        """ Count an access of key """
+        with self.lock:
+            indexes = self._indexes(key)
+            count = min(row[index] for row, index in zip(self.rows, indexes))
+            if count < MAX_COUNT:
+                # Conservative update: only increment the smallest counters, the others already
+                # overestimate the key's count
+                for row, index in zip(self.rows, indexes):
+                    if row[index] == count:
+                        row[index] = count + 1
+
+            self.additions += 1
+            if self.additions >= self.sample_size:
+                self._age()
+
+    def _age(self):
+        """ Halve all counters, older accesses count for less """
+        self.rows = [bytearray(count >> 1 for count in row) for row in self.rows]
+        self.additions //= 2
+
+    def estimate(self, key):
+        """ Return the estimated amount of (recent) accesses of key """
+        with self.lock:
+            return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
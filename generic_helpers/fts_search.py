@@ -0,0 +1,113 @@
+""" Search with a SQLite FTS5 full-text index
+
+    see: https://www.sqlite.org/fts5.html
+
+    The FTS5 table is an 'external content' table: it only holds the index, the content itself is read
+    from the model's table. Triggers on the model's table keep the index in sync on every INSERT, UPDATE
+    and DELETE, regardless if the change is made by this application or by anything else.
+
+    The 'trigram' tokenizer is used, which makes a MATCH behave like a case-insensitive substring
+    search (just like 'has_matching_adjacent_characters' in levenshtein.py). Queries need to be at
+    least three characters long.
+"""
+from flask import current_app
+from sqlalchemy import text, table, column, select
+from sqlalchemy.exc import OperationalError
+from database import db
+from generic_helpers.levenshtein import fetch_by_ids
+
+
+def fts_table_name(model):
+    """ Name of the FTS5 table for a model """
+    return f'{model.__tablename__}_fts'
+
+
+def create_fts_index(model, field_names):
+    """ Create the FTS5 table and its triggers for model (if they don't exist yet)
+
+        Returns True if the index is available, False if this SQLite build doesn't support FTS5
+    """
+    table_name = model.__tablename__
+    fts_table = fts_table_name(model)
+    columns = ', '.join(field_names)
+    new_values = ', '.join(f'new.{field_name}' for field_name in field_names)
+    old_values = ', '.join(f'old.{field_name}' for field_name in field_names)
+
+    # Check if the index was created before, if not we need to index the existing rows
+    exists = db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': fts_table}
+    ).first() is not None
+
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{columns}, content='{table_name}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE ON {table_name} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+    ]
+
+    try:
+        for statement in statements:
+            db.session.execute(text(statement))
+
+        # Index the rows which were present before the index existed
+        if not exists:
+            db.session.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+        db.session.commit()
+    except OperationalError as error:
+        # E.g. 'no such module: fts5' or 'no such tokenizer: trigram' on older SQLite builds
+        db.session.rollback()
+        current_app.logger.warning('FTS5 index not available: %s', error)
+        return False
+    return True
+
+
+def build_match_expression(query, field_names):
+    """ Build an FTS5 MATCH expression searching the query as a phrase in field_names """
+
+    # Quote the query as a phrase (double quotes are escaped by doubling them), so characters which
+    # have a meaning in the FTS5 query syntax (e.g. '-', '*', ':') are searched literally
+    phrase = '"' + query.replace('"', '""') + '"'
+    return f"{{{' '.join(field_names)}}} : {phrase}"
+
+
+def search_by_fts(query, model=None, field_names=None, limit=None, filters=None):
+    """ Search by FTS5 full-text index
+
+        Returns a list of (item, rank) tuples ordered on rank (best match first, ties in table order), just like
+        search_by_levenshtein returns (item, distance) tuples. The ranking, the optional filters
+        (SQLAlchemy expressions on model) and the LIMIT are all computed by SQLite. Raises an
+        OperationalError if the FTS5 index doesn't exist.
+    """
+
+    # Check if a model is provided
+    if model is None or not field_names:
+        raise ValueError('model and field_names cannot be None')
+
+    # The trigram tokenizer can't match anything shorter than three characters
+    if len(query) < 3:
+        return []
+
+    # SELECT rowid, rank FROM <fts> JOIN <table> ON id = rowid WHERE <fts> MATCH ... ORDER BY rank
+    fts_table = table(fts_table_name(model), column('rowid'), column('rank'))
+    statement = (
+        select(fts_table.c.rowid, fts_table.c.rank)
+        .join(model, model.id == fts_table.c.rowid)
+        .where(text(f'{fts_table_name(model)} MATCH :match'), *(filters or []))
+        .order_by(fts_table.c.rank, fts_table.c.rowid)
+    )
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    rows = db.session.execute(
+        statement, {'match': build_match_expression(query, field_names)}
+    ).all()
+
+    # Fetch the matching items and keep the order of the ranking
+    items = fetch_by_ids(model, [row_id for row_id, _ in rows])
+    return [(items[row_id], rank) for row_id, rank in rows if row_id in items]
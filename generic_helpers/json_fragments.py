@@ -0,0 +1,38 @@
+""" Assemble JSON responses from pre-encoded fragments
+
+    jsonify encodes every task of a page again on every request, also when the page itself is a cache
+    hit. The encoding of a task only changes when the task changes, so the row store (see:
+    row_store.py) keeps it as bytes next to the serialized task. A page response is assembled by
+    joining those fragments into the 'result' list of the envelope, only the few other fields of the
+    envelope (e.g. current_page) are encoded per request.
+
+    The fragments are encoded like jsonify does outside debug mode: compact, keys sorted, non-ASCII
+    characters escaped. A response is byte for byte the same as jsonify(envelope).
+"""
+import json
+from http import HTTPStatus
+from flask import current_app
+
+
+def encode_json(value):
+    """ Encode a value into compact JSON bytes, with sorted keys """
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def assemble_json(envelope, fragments, key='result'):
+    """ Return the JSON bytes of the envelope (a dict), with key holding the list of encoded fragments
+
+        The value of key in the envelope (if any) is replaced by the fragments
+    """
+    members = []
+    for name in sorted(set(envelope) | {key}):
+        value = b'[' + b','.join(fragments) + b']' if name == key else encode_json(envelope[name])
+        members.append(encode_json(name) + b':' + value)
+    return b'{' + b','.join(members) + b'}\n'
+
+
+def json_fragments_response(envelope, fragments, key='result', status=HTTPStatus.OK):
+    """ Return a JSON response of the envelope, with key holding the list of encoded fragments """
+    return current_app.response_class(
+        assemble_json(envelope, fragments, key=key), status=status, mimetype='application/json'
+    )
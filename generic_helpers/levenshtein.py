@@ -1,5 +1,19 @@
 """ Search with a model and field levenshtein distance """
 from Levenshtein import distance
+from generic_helpers.search_index import get_search_index
+
+# SQLite refuses statements with too many bound parameters, fetch candidates in chunks
+FETCH_CHUNK_SIZE = 500
+
+# Strategies which use an index (see: search_index.py), the 'scan' strategy doesn't
+INDEX_STRATEGIES = ('trigram', 'bktree', 'batch', 'parallel')
+
+# Strategies which split their work over 'workers' processes
+WORKER_STRATEGIES = ('parallel',)
+
+# Default threshold, the matches are closer than this distance. The 'bktree' strategy only prunes with
+# a tight threshold (e.g. 3), at this default it compares nearly every value
+THRESHOLD = 21
 
 
 def has_matching_adjacent_characters(query, field_value, threshold=3):
@@ -9,45 +23,167 @@ def has_matching_adjacent_characters(query, field_value, threshold=3):
     return query.lower() in field_value.lower() and len(query) >= threshold
 
 
-def search_by_levenshtein(query, model=None, field_name=None, threshold=21):
+def get_index(model, field_name, strategy='trigram', **options):
+    """ Return the index of a strategy for model.field_name (see: search_index.py) """
+    return get_search_index(model, field_name).get_index(strategy, **options)
+
+
+# pylint: disable=too-many-arguments
+def score_by_levenshtein(query, model=None, field_name=None, threshold=THRESHOLD, strategy='trigram', workers=1):
+    """ Score the query against the search index of model.field_name
+
+        Returns a dict id -> distance of the items within the threshold distance which have matching
+        adjacent characters. Nothing is fetched from the database. See search_by_levenshtein for the
+        strategies, except for 'scan' which doesn't have an index.
+    """
+
+    # Check if a model is provided
+    if model is None or field_name is None:
+        raise ValueError('model and field cannot be None')
+
+    # Check if the field is part of the table
+    if not hasattr(model, field_name):
+        raise AttributeError('No such field in table')
+
+    if strategy not in INDEX_STRATEGIES:
+        raise ValueError(f'Unknown search strategy: {strategy}')
+
+    # A query shorter than three characters never has matching adjacent characters
+    if not has_matching_adjacent_characters(query, query):
+        return {}
+
+    normalized_query = query.lower()
+    options = {'workers': workers} if strategy in WORKER_STRATEGIES else {}
+    index = get_index(model, field_name, strategy, **options)
+    scored = {}
+    if strategy != 'trigram':
+        # Every value within the threshold distance, check if it has matching adjacent characters
+        for item_id, field_value, distance_value in index.search(query, threshold - 1):
+            if normalized_query in field_value:
+                scored[item_id] = distance_value
+    else:
+        # Every candidate contains the query, compute the word distance for the candidates only
+        for item_id, field_value in index.search_substring(query):
+            distance_value = distance(normalized_query, field_value)
+            if distance_value < threshold:
+                scored[item_id] = distance_value
+    return scored
+
+
+def iter_by_ids(model, ids, filters=None):
+    """ Fetch the items of model for a collection of ids, yields the items chunk by chunk
+
+        Optional filters (SQLAlchemy expressions) are added to the WHERE clause, ids of
+        items which don't match the filters are left out of the result
+    """
+    ids = list(ids)
+    for start in range(0, len(ids), FETCH_CHUNK_SIZE):
+        chunk = ids[start:start + FETCH_CHUNK_SIZE]
+        yield from model.query.filter(model.id.in_(chunk), *(filters or []))
+
+
+def fetch_by_ids(model, ids, filters=None):
+    """ Fetch the items of model for a collection of ids, returns a dict id -> item """
+    return {item.id: item for item in iter_by_ids(model, ids, filters=filters)}
+
+
+# pylint: disable=too-many-arguments
+def search_by_levenshtein(query, model=None, field_name=None, threshold=THRESHOLD, strategy='trigram', filters=None,
+                          workers=1):
     """ Search by levenshtein word distance (case-insensitive)
 
         see: https://en.wikipedia.org/wiki/Levenshtein_distance for a comprehensive
         explanation what levenshtein distance is.
 
-        This method allows you to query a string upon a given field in a given model
+        This method allows you to query a string upon a given field in a given model.
+
+        The strategy decides how the candidates are found, all strategies give the same result:
+
+        - 'trigram' (default): look up the candidates in a trigram index (see: trigram_index.py), which
+          answers the 'has_matching_adjacent_characters' rule. Only those candidates are scored.
+        - 'bktree': look up the values within the threshold distance in a BK-tree (see: bk_tree.py).
+          The tighter the threshold, the less values are compared.
+        - 'batch': score all (pre-normalized) values in one native call with an early exit at the
+          threshold (see: title_array.py).
+        - 'parallel': like 'batch', but the values are sharded in shared memory and scored by a
+          pool of 'workers' processes (see: parallel_search.py).
+        - 'scan': score every row of the table.
+
+        Only the matching items are fetched from the database. Optional filters (a list of SQLAlchemy
+        expressions, e.g. [Task.status == TaskStatus.PENDING]) are applied by the database.
+
+        Returns a list of (item, distance) tuples sorted on distance (ties in table order)
+    """
+    matches = iter_search_by_levenshtein(
+        query, model=model, field_name=field_name, threshold=threshold, strategy=strategy,
+        filters=filters, workers=workers
+    )
+    return sorted(matches, key=lambda x: (x[1], x[0].id))
+
+
+# pylint: disable=too-many-arguments
+def iter_search_by_levenshtein(query, model=None, field_name=None, threshold=THRESHOLD, strategy='trigram',
+                               filters=None, workers=1):
+    """ Search by levenshtein word distance, yields (item, distance) tuples in no particular order
+
+        Unlike search_by_levenshtein the matches are not collected and sorted, they are fetched
+        from the database and yielded chunk by chunk (see: search_by_levenshtein for the arguments)
     """
 
     # Check if a model is provided
     if model is None or field_name is None:
         raise ValueError('model and field cannot be None')
 
-    # Create an empty results list
-    results = []
-
     # NOTE: If we provide a model that doesn't exist, we expect a 500 (internal server error)
     # handled by the generic Flask @api.errorhandler(InternalServerError) handler
 
-    for item in model.query.all():
-        # Check if the field is part of the table
-        if not hasattr(item, field_name):
-            raise AttributeError('No such field in table')
+    # Check if the field is part of the table
+    if not hasattr(model, field_name):
+        raise AttributeError('No such field in table')
+
+    if strategy == 'scan':
+        yield from iter_scan_by_levenshtein(
+            query, model=model, field_name=field_name, threshold=threshold, filters=filters
+        )
+        return
+
+    scored = score_by_levenshtein(
+        query, model=model, field_name=field_name, threshold=threshold, strategy=strategy, workers=workers
+    )
+
+    # Fetch the matching items and augment them with their distance_value
+    for item in iter_by_ids(model, scored, filters=filters):
+        yield item, scored[item.id]
+
+
+def scan_by_levenshtein(query, model=None, field_name=None, threshold=THRESHOLD, filters=None):
+    """ Search by levenshtein word distance by scanning every row of the table """
+
+    # Collect the matches of the scan
+    results = list(
+        iter_scan_by_levenshtein(query, model=model, field_name=field_name, threshold=threshold, filters=filters)
+    )
+
+    # Sort the list based on the second element (distance_value)
+    sorted_list = sorted(results, key=lambda x: x[1])
+
+    # Return the sorted_list of augmented results
+    return sorted_list
+
+
+def iter_scan_by_levenshtein(query, model=None, field_name=None, threshold=THRESHOLD, filters=None):
+    """ Scan every row of the table, yields (item, distance) tuples for the matches in table order """
 
+    for item in model.query.filter(*(filters or [])):
         # Get the value of the field from the item
         field_value = getattr(item, field_name)
 
         # Calculate the word distance on current item
         distance_value = distance(query.lower(), field_value.lower())
 
-        # Augment the item with the distance_value and add to results list if and only if
+        # Augment the item with the distance_value and yield it if and only if
         # it's within the threshold distance
         if distance_value < threshold:
-            # Check if at least three adjacent character match the query before adding to the result
+            # Check if at least three adjacent character match the query before yielding
             if has_matching_adjacent_characters(query, field_value):
-                results.append((item, distance_value))
-
-    # Sort the list based on the second element (distance_value)
-    sorted_list = sorted(results, key=lambda x: x[1])
-
-    # Return the sorted_list of augmented results
-    return sorted_list
+                yield item, distance_value
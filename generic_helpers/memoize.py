@@ -48,18 +48,113 @@
     Behaviour:
 
     - When the `ttl` has expired for a cached item, the cache is invalid and will be cleared on next call.
-    - When the amount of items exceeds the `max_items`, items with will be purged by ttl until `max_items` are
-      present in the cache
+    - When the amount of items exceeds the `max_items`, the least recently used items are purged until
+      `max_items` are present in the cache
     - `ttl` can be overriden for a specific use case by setting the `ttl` in the decorator as a `kwarg`
     - `max_items` and `ttl` are set to a chosen value on class initialization, when omitted they default to
       `ttl:` 300 seconds and `max_items:` 128 items.
+    - Optionally the cache is bounded by `max_bytes` as well: the approximate size of every item is
+      accounted for (see: approximate_size), the least recently used items are purged until the cache
+      fits. An item larger than `max_bytes` on its own is not cached. `usage()` returns the current
+      amount of items and bytes.
 
     Dependencies:
 
-    Memoize depends on the python build-ins `time` and `functools`
+    Memoize depends on the python build-ins `functools`, `threading` and `concurrent`, and on
+    memoize_backends.py
+
+    Storage:
+
+    The items are stored by a backend (see: memoize_backends.py). By default that's a MemoryBackend:
+    an OrderedDict in order of use, the least recently used item first. A hit moves its item to the
+    end and a purge pops the first item, both are O(1). Expired items are not searched for, they are
+    removed when they are looked up (or purged when they are not used anymore). A SQLiteBackend
+    shares the items, and their invalidation, between all processes on the host:
+
+    memoize = Memoize(ttl=300, backend=SQLiteBackend('/tmp/memoize.db', max_items=300))
+
+    Concurrency:
+
+    The cache is safe to use from multiple threads. Concurrent misses on the same key are coalesced
+    (single-flight): the first caller executes the function, the others wait for its result (or its
+    exception). A result is not stored when the cache was cleared or invalidated (by any process
+    sharing the backend) while it was computed, it might have been computed from data which was
+    changed in the meantime.
+
+    The lock of the instance only guards the state in this process (the results being computed, the
+    counters and the admission policy). The backend is called outside of it, a lookup or store in a
+    SQLiteBackend (disk I/O) doesn't block the callers of the other keys.
+
+    Invalidation:
+
+    Instead of clearing all cache after a change, items can be invalidated by what they depend on.
+    Decorate with a `tags` function, it's called with the result and the arguments of the function
+    and returns the tags of the item (anything, e.g. a dict of filters). `invalidate(match)` removes
+    the items for which match(tags) is true, items without tags are always removed:
+
+    @memoize(tags=lambda result, year, age=None: {'year': year})
+    def students(year, age=None):
+        ...
+
+    memoize.invalidate(lambda tags: tags['year'] == 2023)
+
+    Metrics:
+
+    `stats()` returns the counters of the instance and of every memoized function: hits, misses,
+    expirations (lookups which found an expired item), coalesced (callers which waited for a
+    concurrent computation), the time spent computing and the time saved by the hits. The time
+    saved is estimated from the average compute time of the function. Evictions are counted per
+    instance, an item evicted to make room doesn't belong to the function which caused it.
+
+    Stale-while-revalidate:
+
+    Decorate with a `stale_ttl` to keep serving an expired result for stale_ttl more seconds, while
+    it's computed again in a background thread (once, concurrent callers get the stale result too).
+    The function runs without the context of the caller (e.g. a Flask application context), pass a
+    `context` factory: it's called by the caller and returns a context manager which is entered by
+    the background thread. A clear or invalidation removes stale results as well.
+
+    @memoize(ttl=60, stale_ttl=30, context=lambda: current_app._get_current_object().app_context())
+    def search(key, query):
+        ...
+
+    Admission:
+
+    By default every result is stored, when the cache is full a burst of one-off keys (e.g. a long tail
+    of different searches) pushes out the frequently used items. With an admission policy (a
+    FrequencySketch, see: frequency_sketch.py) every lookup of a key is counted, and a new result
+    is only stored when its key is used more often than the key it would evict (TinyLFU). A rejected
+    result is still returned to its callers.
+
+    memoize = Memoize(max_items=300, admission=FrequencySketch(width=4096))
+
+    Compression:
+
+    With a codec (e.g. a ZlibCodec, see: memoize_codecs.py) large results are stored pickled and
+    compressed, and decoded on every hit. More results fit in the same max_bytes, at the cost of
+    CPU time: the metrics report the compressions, the raw and compressed bytes and the time spent
+    encoding and decoding.
+
+    memoize = Memoize(max_bytes=64 * 1024 * 1024, codec=ZlibCodec(threshold=16384))
 """
+import contextlib
 import functools
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import Future
+from generic_helpers.memoize_backends import MemoryBackend, HIT, STALE, EXPIRED
+from generic_helpers.memoize_codecs import Compressed
+
+# Counters kept per memoized function (see: stats)
+COUNTERS = (
+    'hits', 'stale_hits', 'misses', 'expirations', 'coalesced', 'refreshes', 'rejections', 'computations',
+    'compute_time', 'compressions', 'decompressions', 'raw_bytes', 'compressed_bytes', 'encode_time',
+    'decode_time',
+)
+
+# The settings of a memoized function
+Memoized = namedtuple('Memoized', ('name', 'func', 'ttl', 'tags', 'stale_ttl', 'context'))
 
 TTL = 300
 MAX_ITEMS = 128
@@ -87,63 +182,268 @@ class Memoize:
         return result
     """
 
-    def __init__(self, ttl=TTL, max_items=MAX_ITEMS):
-        self.memoize_cache = {}
+    # pylint: disable=too-many-arguments
+    def __init__(self, ttl=TTL, max_items=MAX_ITEMS, max_bytes=None, backend=None, admission=None, codec=None):
         self.ttl = ttl
-        self.max_items = max_items
-
-    def _add_cache(self, key, value, ttl):
-        """Store cache item"""
-        self.memoize_cache[key] = (time.time() + ttl, value)
-
-    def _clean_cache(self):
-        """Clear expired cached items"""
-        now = time.time()
-        self.memoize_cache = {
-            key: value for key, value in self.memoize_cache.items() if now <= value[0]
-        }
-
-        # Remove all items more than self.max_items by cache-age
-        sorted_cache = sorted(
-            self.memoize_cache.items(), key=lambda x: x[1][0], reverse=False
+
+        # Optional admission policy (see: Admission) and codec (see: Compression)
+        self.admission = admission
+        self.codec = codec
+
+        # The max_items and max_bytes are the bounds of the default backend, a given backend has its own
+        self.backend = backend if backend is not None else MemoryBackend(max_items, max_bytes=max_bytes)
+
+        # Futures of the results being computed, by key (see: Concurrency)
+        self.in_flight = {}
+        self.lock = threading.RLock()
+
+        # Counters by function name, and the evictions of the instance (see: Metrics)
+        self.metrics = {'functions': {}, 'evictions': 0}
+
+    def _count(self, name, counter, amount=1):
+        """Increment a counter of a function, the lock must be held"""
+        functions = self.metrics['functions']
+        counters = functions.get(name)
+        if counters is None:
+            counters = functions[name] = dict.fromkeys(COUNTERS, 0)
+        counters[counter] += amount
+
+    def stats(self):
+        """ Return a snapshot of the counters of the instance and its functions (see: Metrics) """
+
+        def served(counters):
+            # Lookups answered without waiting for a computation of their own
+            return counters['hits'] + counters['stale_hits'] + counters['coalesced']
+
+        def summarize(counters):
+            lookups = served(counters) + counters['misses']
+            average_compute_time = (
+                counters['compute_time'] / counters['computations'] if counters['computations'] else 0.0
+            )
+            # Decoding compressed results is the price paid on the hits (see: Compression)
+            return dict(
+                counters,
+                hit_ratio=served(counters) / lookups if lookups else 0.0,
+                time_saved=served(counters) * average_compute_time - counters['decode_time'],
+            )
+
+        with self.lock:
+            functions = {name: summarize(counters) for name, counters in self.metrics['functions'].items()}
+            evictions = self.metrics['evictions']
+        usage = self.backend.usage()
+
+        totals = dict.fromkeys(COUNTERS + ('time_saved',), 0)
+        for counters in functions.values():
+            for counter in totals:
+                totals[counter] += counters[counter]
+        lookups = served(totals) + totals['misses']
+        return dict(
+            totals,
+            hit_ratio=served(totals) / lookups if lookups else 0.0,
+            evictions=evictions,
+            usage=usage,
+            functions=functions,
         )
-        for key, value in sorted_cache:
-            if len(self.memoize_cache) - self.max_items <= 0:
-                break
-            del self.memoize_cache[key]
+
+    def reset_stats(self):
+        """ Reset all counters """
+        with self.lock:
+            self.metrics = {'functions': {}, 'evictions': 0}
+
+    def usage(self):
+        """ Return the current amount of items and their (approximate) size in bytes
+
+            The size is None when the memory backend has no max_bytes budget, it isn't computed then
+        """
+        return self.backend.usage()
 
     def clear_all_cache(self):
         """ Clear all cache """
-        self.memoize_cache = {}
+        self.backend.clear()
+
+        # Results being computed are not stored, and next callers don't wait for them
+        with self.lock:
+            self.in_flight = {}
 
     def clear_cache_by_key(self, key):
         """ Clear cache by key """
-        self.memoize_cache.pop(key, None)
+        self.backend.delete(key)
+        with self.lock:
+            self.in_flight.pop(key, None)
+
+    def invalidate(self, match):
+        """ Clear the cache items for which match(tags) is true, and all items without tags """
+        self.backend.invalidate(match)
+
+        # The tags of results being computed are not known yet, don't store them
+        with self.lock:
+            self.in_flight = {}
+
+    def _compute(self, memoized, args, kwargs):
+        """Return the cached result, or execute the function (once for concurrent callers of the
+        same key) and fill the cache
+        """
+        key = args[0]
+
+        # Check if key in cache, and not expired. The backend is called outside the lock (see: Concurrency)
+        status, result = self.backend.get(key)
+
+        refresh = leader = False
+        with self.lock:
+            if self.admission is not None:
+                self.admission.increment(key)
+
+            if status == HIT:
+                self._count(memoized.name, 'hits')
+
+            # Serve the stale result, and refresh it in the background (unless that's happening already)
+            elif status == STALE:
+                self._count(memoized.name, 'stale_hits')
+                if key not in self.in_flight:
+                    self._count(memoized.name, 'refreshes')
+                    future = self.in_flight[key] = Future()
+                    refresh = True
+
+            # Another thread is computing this key, wait for its result
+            else:
+                if status == EXPIRED:
+                    self._count(memoized.name, 'expirations')
+                future = self.in_flight.get(key)
+                if future is not None:
+                    self._count(memoized.name, 'coalesced')
+                else:
+                    self._count(memoized.name, 'misses')
+                    future = self.in_flight[key] = Future()
+                    leader = True
+
+        # The generation is read before the computation starts, a clear or invalidation (in any process)
+        # after this changes it and the result is not stored
+        if refresh:
+            threading.Thread(
+                target=self._refresh,
+                args=(memoized, args, kwargs, future, self.backend.generation(), memoized.context()),
+                daemon=True,
+            ).start()
+
+        # Decode outside the lock, it can take a while (see: Compression)
+        if status in (HIT, STALE):
+            return self._decode(memoized, result)
+        if not leader:
+            return future.result()
+        return self._run(memoized, args, kwargs, future, self.backend.generation())
+
+    def _encode(self, memoized, result):
+        """Return the value to store for a result (see: Compression)"""
+        if self.codec is None:
+            return result
+        started = time.perf_counter()
+        stored = self.codec.encode(result)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self._count(memoized.name, 'encode_time', elapsed)
+            if isinstance(stored, Compressed):
+                self._count(memoized.name, 'compressions')
+                self._count(memoized.name, 'raw_bytes', stored.raw_size)
+                self._count(memoized.name, 'compressed_bytes', len(stored.data))
+        return stored
+
+    def _decode(self, memoized, stored):
+        """Return the result of a stored value (see: Compression)"""
+        if self.codec is None or not isinstance(stored, Compressed):
+            return stored
+        started = time.perf_counter()
+        result = self.codec.decode(stored)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self._count(memoized.name, 'decompressions')
+            self._count(memoized.name, 'decode_time', elapsed)
+        return result
 
-    def __call__(self, func=None, ttl=None):
+    def _admit(self, memoized, key):
+        """Check if a result for key may be stored (see: Admission)"""
+        if self.admission is None:
+            return True
+        victim = self.backend.victim(key)
+        with self.lock:
+            if victim is None or self.admission.estimate(key) > self.admission.estimate(victim):
+                return True
+            self._count(memoized.name, 'rejections')
+            return False
+
+    def _refresh(self, memoized, args, kwargs, future, generation, context):  # pylint: disable=too-many-arguments
+        """Background thread: compute a stale result again, within the context of the caller"""
+        try:
+            with context:
+                self._run(memoized, args, kwargs, future, generation)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # The stale result is served until it expires, the next miss raises the exception to a caller
+            pass
+
+    def _run(self, memoized, args, kwargs, future, generation):  # pylint: disable=too-many-arguments
+        """Execute the function, store the result and resolve the future of the waiting callers"""
+        key = args[0]
+
+        # Execute the function outside the lock so other keys are not blocked
+        started = time.perf_counter()
+        try:
+            result = memoized.func(*args, **kwargs)
+        except BaseException as error:
+            with self.lock:
+                if self.in_flight.get(key) is future:
+                    del self.in_flight[key]
+            future.set_exception(error)
+            raise
+
+        # Encode outside the lock, it can take a while (see: Compression)
+        stored = self._encode(memoized, result)
+
+        compute_time = time.perf_counter() - started
+
+        # Only store the result when the cache wasn't cleared during the computation: a clear in
+        # this process removes the future from in_flight, a clear in any process changes the
+        # generation of the backend (which the backend checks when it stores the result)
+        with self.lock:
+            store = self.in_flight.get(key) is future
+            if store:
+                del self.in_flight[key]
+
+        # The admission policy might reject the result (see: Admission)
+        evictions = 0
+        if store and self._admit(memoized, key):
+            evictions = self.backend.set(
+                key,
+                stored,
+                self.ttl if memoized.ttl is None else memoized.ttl,
+                tags=None if memoized.tags is None else memoized.tags(result, *args, **kwargs),
+                generation=generation,
+                stale_ttl=memoized.stale_ttl,
+            )
+
+        # Counted once the result is stored
+        with self.lock:
+            self._count(memoized.name, 'computations')
+            self._count(memoized.name, 'compute_time', compute_time)
+            self.metrics['evictions'] += evictions
+        future.set_result(result)
+        return result
+
+    # pylint: disable=too-many-arguments
+    def __call__(self, func=None, ttl=None, tags=None, stale_ttl=0, context=None):
         if func is None:
-            return functools.partial(self.__call__, ttl=ttl)
+            return functools.partial(self.__call__, ttl=ttl, tags=tags, stale_ttl=stale_ttl, context=context)
+
+        # The settings of this function, its counters are kept by name (see: Metrics)
+        memoized = Memoized(
+            name=f'{func.__module__}.{func.__qualname__}',
+            func=func,
+            ttl=ttl,
+            tags=tags,
+            stale_ttl=stale_ttl,
+            context=context if context is not None else contextlib.nullcontext,
+        )
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Set ttl for this cache item
-            _ttl = self.ttl if ttl is None else ttl
-
-            # Check if key in cache
-            if args[0] in self.memoize_cache:
-                # if key is not expired, return result
-                if time.time() - self.memoize_cache[args[0]][0] <= _ttl:
-                    result = self.memoize_cache[args[0]][1]
-                    self._clean_cache()
-                    return result
-
-                # Remove expired key
-                del self.memoize_cache[args[0]]
-
-            # Cache miss, execute the function and fill the cache
-            result = func(*args, **kwargs)
-            self._add_cache(args[0], result, _ttl)
-            self._clean_cache()
-            return result
+            return self._compute(memoized, args, kwargs)
 
         return wrapper
@@ -0,0 +1,515 @@
+""" Storage backends for Memoize
+
+    A backend stores the cache items: key -> (expiry, value, tags, size, fresh), in order of use. Memoize
+    takes care of the single-flight within a process, a backend only stores, looks up, purges and
+    invalidates items. Memoize calls the backend outside its own lock (a SQLite lookup is disk I/O), every
+    backend is safe to use from multiple threads.
+
+    - MemoryBackend (default): an OrderedDict in this process.
+    - SQLiteBackend: a table in a SQLite database file, shared by all processes on the host which
+      use the same file. An item computed by one process is a hit for the others, and an
+      invalidation by one process removes the items for all of them. Values and tags are pickled,
+      only share the file between processes of the same (trusted) application.
+    - TieredBackend: a MemoryBackend (L1) in front of a SQLiteBackend (L2) on disk. The disk tier
+      survives restarts, after a deploy the memory tier is filled from it on first use.
+
+    get() returns a (status, value) tuple, the status is HIT, MISS, EXPIRED (the item was found but
+    expired, it's removed) or STALE. An item stored with a stale_ttl is fresh for ttl seconds, and
+    stale (but still returned) for stale_ttl seconds after that. set() returns the amount of items
+    evicted to make room for the new one, victim() returns the item which would be evicted first.
+
+    Every backend keeps a generation counter, it's incremented by every clear and invalidation. Memoize
+    passes the generation read before it computed a result to set(), the result is not stored when
+    the generation changed in the meantime (in any process), it might be stale.
+"""
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Status of a lookup
+HIT = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+EXPIRED = 'expired'
+
+# A hit marks the item as used in the SQLite table at most once per interval, instead of writing on every hit
+TOUCH_INTERVAL = 1.0
+
+
+def approximate_size(value):
+    """Approximate the memory (in bytes) held by a value, including the containers' contents
+
+    Walks dicts, lists, tuples and sets (without recursion, results can be deeply nested) and
+    counts every object once, e.g. an interned string used as key in many dicts.
+    """
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return size
+
+
+class MemoryBackend:
+    """ Cache items in an OrderedDict, the least recently used item first
+
+    A hit moves its item to the end and a purge pops the first item, both are O(1). The size of
+    the items is only computed when there is a max_bytes budget (see: approximate_size).
+    """
+
+    def __init__(self, max_items, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.current_bytes = 0
+        self.current_generation = 0
+        self.lock = threading.RLock()
+
+    def generation(self):
+        """ Return the generation counter (see: module) """
+        return self.current_generation
+
+    def keys(self):
+        """ Return the keys, the least recently used first """
+        with self.lock:
+            return list(self.items)
+
+    def get(self, key):
+        """ Return (HIT or STALE, value) for an item which isn't expired, (MISS or EXPIRED, None) otherwise """
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return MISS, None
+
+            # The item is expired, remove it
+            expiry, value, _, _, fresh = item
+            now = time.time()
+            if now > expiry:
+                self.delete(key)
+                return EXPIRED, None
+
+            # Mark the item as most recently used
+            self.items.move_to_end(key)
+            return HIT if now <= fresh else STALE, value
+
+    # pylint: disable=too-many-arguments
+    def set(self, key, value, ttl, tags=None, generation=None, stale_ttl=0):
+        """ Store an item, unless the generation changed since it was read. Returns the amount of
+            evicted items
+        """
+        with self.lock:
+            if generation is not None and generation != self.current_generation:
+                return 0
+            now = time.time()
+            return self.restore(key, value, tags, now + ttl + stale_ttl, now + ttl)
+
+    def restore(self, key, value, tags, expiry, fresh):  # pylint: disable=too-many-arguments
+        """ Store an item with its (absolute) expiry and fresh times, e.g. an item loaded from another
+            tier. Returns the amount of evicted items
+        """
+        size = 0
+        if self.max_bytes is not None:
+            size = approximate_size(value)
+        with self.lock:
+            self.delete(key)
+
+            # It would push every other item out, and not fit itself
+            if self.max_bytes is not None and size > self.max_bytes:
+                return 0
+            self.items[key] = (expiry, value, tags, size, fresh)
+            self.current_bytes += size
+            return self._purge()
+
+    def _purge(self):
+        """ Remove the least recently used items, until there are no more than max_items and
+            they fit in max_bytes, the lock must be held. Returns the amount of removed items
+        """
+        purged = 0
+        while len(self.items) > self.max_items or (
+            self.max_bytes is not None and self.current_bytes > self.max_bytes
+        ):
+            _, item = self.items.popitem(last=False)
+            self.current_bytes -= item[3]
+            purged += 1
+        return purged
+
+    def victim(self, key):
+        """ Return the key which is evicted first when key is stored, None if nothing is evicted
+
+            Only the amount of items is taken into account, not their size
+        """
+        with self.lock:
+            if key in self.items or len(self.items) < self.max_items:
+                return None
+            return next(iter(self.items))
+
+    def delete(self, key):
+        """ Remove an item (if present) """
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is not None:
+                self.current_bytes -= item[3]
+
+    def clear(self):
+        """ Remove all items """
+        with self.lock:
+            self.items = OrderedDict()
+            self.current_bytes = 0
+            self.current_generation += 1
+
+    def invalidate(self, match):
+        """ Remove the items for which match(tags) is true, and all items without tags """
+        with self.lock:
+            for key in [key for key, (_, _, tags, _, _) in self.items.items() if tags is None or match(tags)]:
+                self.delete(key)
+            self.current_generation += 1
+
+    def usage(self):
+        """ Return the amount of items and their size (None when there is no max_bytes budget) """
+        with self.lock:
+            return {
+                'items': len(self.items),
+                'max_items': self.max_items,
+                'bytes': self.current_bytes if self.max_bytes is not None else None,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class SQLiteBackend:
+    """ Cache items in a SQLite table, shared by all processes using the same database file
+
+    Example usage:
+
+    memoize = Memoize(backend=SQLiteBackend('/tmp/memoize.db', max_items=300))
+
+    Keys are stored as is (the column has no type), they should be strings or numbers. The size of
+    an item is the size of its pickled value. The items are purged in order of use, the 'used' time
+    of an item is updated at most once per TOUCH_INTERVAL. Every thread has its own connection, the
+    database is in WAL mode so readers don't block the writer.
+
+    The tags are stored once per distinct value in a side table, the items refer to them by an indexed
+    id. An invalidation matches every distinct tags value once, outside the write transaction, and
+    deletes the items by the ids of the matching ones.
+    """
+
+    def __init__(self, path, max_items, max_bytes=None):
+        self.path = path
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+
+        with self._transaction() as connection:
+            # It's only a cache, a table of an older layout is dropped instead of migrated
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(memoize)')]
+            if columns and 'tags_id' not in columns:
+                connection.execute('DROP TABLE memoize')
+                connection.execute('DROP TABLE IF EXISTS memoize_tags')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS memoize ('
+                'key PRIMARY KEY, value BLOB, expiry REAL, tags_id INTEGER, size INTEGER, used REAL, fresh REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS memoize_used ON memoize (used)')
+            connection.execute('CREATE INDEX IF NOT EXISTS memoize_expiry ON memoize (expiry)')
+            connection.execute('CREATE INDEX IF NOT EXISTS memoize_tags_id ON memoize (tags_id)')
+
+            # The distinct (pickled) tags, items with the same tags share a row
+            connection.execute('CREATE TABLE IF NOT EXISTS memoize_tags (id INTEGER PRIMARY KEY, tags BLOB UNIQUE)')
+            connection.execute('CREATE TABLE IF NOT EXISTS memoize_generation (generation INTEGER)')
+            connection.execute(
+                'INSERT INTO memoize_generation SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM memoize_generation)'
+            )
+
+    def _connection(self):
+        """ Return the connection of this thread (a connection can't be shared by threads) """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or getattr(self.local, 'pid', None) != os.getpid():
+            # Autocommit mode, the transactions are started explicitly (see: _transaction)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def _transaction(self):
+        """ Return a context manager running a write transaction """
+        return _Transaction(self._connection())
+
+    def generation(self):
+        """ Return the generation counter (see: module) """
+        return self._connection().execute('SELECT generation FROM memoize_generation').fetchone()[0]
+
+    def keys(self):
+        """ Return the keys, the least recently used first """
+        return [row[0] for row in self._connection().execute('SELECT key FROM memoize ORDER BY used, rowid')]
+
+    def get(self, key):
+        """ Return (HIT or STALE, value) for an item which isn't expired, (MISS or EXPIRED, None) otherwise """
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT value, expiry, used, fresh FROM memoize WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return MISS, None
+
+        value, expiry, used, fresh = row
+        now = time.time()
+        if now > expiry:
+            connection.execute('DELETE FROM memoize WHERE key = ? AND expiry = ?', (key, expiry))
+            return EXPIRED, None
+
+        # Mark the item as recently used
+        if now - used > TOUCH_INTERVAL:
+            connection.execute('UPDATE memoize SET used = ? WHERE key = ?', (now, key))
+        return HIT if now <= fresh else STALE, pickle.loads(value)
+
+    def entry(self, key):
+        """ Return (value, tags, expiry, fresh) of an item which isn't expired, None otherwise """
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute(
+            'SELECT value, tags, expiry, fresh FROM memoize LEFT JOIN memoize_tags ON memoize_tags.id = tags_id '
+            'WHERE key = ? AND expiry >= ?',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE memoize SET used = ? WHERE key = ?', (now, key))
+        value, tags, expiry, fresh = row
+        return pickle.loads(value), None if tags is None else pickle.loads(tags), expiry, fresh
+
+    # pylint: disable=too-many-arguments
+    def set(self, key, value, ttl, tags=None, generation=None, stale_ttl=0):
+        """ Store an item, unless the generation changed since it was read. Returns the amount of
+            evicted items
+        """
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # It would push every other item out, and not fit itself
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return 0
+
+        tags_data = None if tags is None else pickle.dumps(tags, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._transaction() as connection:
+            if generation is not None and generation != self.generation():
+                return 0
+            tags_id = None
+            if tags_data is not None:
+                connection.execute('INSERT OR IGNORE INTO memoize_tags (tags) VALUES (?)', (tags_data,))
+                tags_id = connection.execute('SELECT id FROM memoize_tags WHERE tags = ?', (tags_data,)).fetchone()[0]
+            connection.execute(
+                'INSERT OR REPLACE INTO memoize (key, value, expiry, tags_id, size, used, fresh) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, data, now + ttl + stale_ttl, tags_id, len(data), now, now + ttl),
+            )
+            connection.execute('DELETE FROM memoize WHERE expiry < ?', (now,))
+            return self._purge(connection)
+
+    def _purge(self, connection):
+        """ Remove the least recently used items, until there are no more than max_items and
+            they fit in max_bytes. Returns the amount of removed items
+        """
+        count, total = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM memoize').fetchone()
+        if count <= self.max_items and (self.max_bytes is None or total <= self.max_bytes):
+            return 0
+
+        purged = []
+        for key, size in connection.execute('SELECT key, size FROM memoize ORDER BY used, rowid'):
+            if count <= self.max_items and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            purged.append((key,))
+            count -= 1
+            total -= size
+        connection.executemany('DELETE FROM memoize WHERE key = ?', purged)
+        return len(purged)
+
+    def victim(self, key):
+        """ Return the key which is evicted first when key is stored, None if nothing is evicted
+
+            Only the amount of items is taken into account, not their size
+        """
+        connection = self._connection()
+        count, present = connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(key = ?), 0) FROM memoize', (key,)
+        ).fetchone()
+        if present or count < self.max_items:
+            return None
+        row = connection.execute('SELECT key FROM memoize ORDER BY used, rowid LIMIT 1').fetchone()
+        return None if row is None else row[0]
+
+    def delete(self, key):
+        """ Remove an item (if present) """
+        self._connection().execute('DELETE FROM memoize WHERE key = ?', (key,))
+
+    def clear(self):
+        """ Remove all items (of all processes) """
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM memoize')
+            connection.execute('DELETE FROM memoize_tags')
+            connection.execute('UPDATE memoize_generation SET generation = generation + 1')
+
+    def invalidate(self, match):
+        """ Remove the items (of all processes) for which match(tags) is true, and all items without tags """
+        # Increment the generation first, a result computed before the invalidation isn't stored from
+        # now on (see: set). The items stored until now are all in the tags read below
+        with self._transaction() as connection:
+            connection.execute('UPDATE memoize_generation SET generation = generation + 1')
+
+        # Unpickle and match the distinct tags outside the write transaction, it doesn't block the writers
+        invalidated = [
+            (tags_id,) for tags_id, tags in self._connection().execute('SELECT id, tags FROM memoize_tags')
+            if match(pickle.loads(tags))
+        ]
+
+        # Delete by the indexed tags id, and the tags which are no longer used by any item
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM memoize WHERE tags_id IS NULL')
+            connection.executemany('DELETE FROM memoize WHERE tags_id = ?', invalidated)
+            connection.execute(
+                'DELETE FROM memoize_tags WHERE id NOT IN (SELECT tags_id FROM memoize WHERE tags_id IS NOT NULL)'
+            )
+
+    def usage(self):
+        """ Return the amount of items and the size of their pickled values """
+        count, total = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM memoize'
+        ).fetchone()
+        return {'items': count, 'max_items': self.max_items, 'bytes': total, 'max_bytes': self.max_bytes}
+
+
+class TieredBackend:
+    """ A MemoryBackend (L1) in front of a SQLiteBackend (L2) on disk
+
+    Example usage:
+
+    memoize = Memoize(backend=TieredBackend(
+        MemoryBackend(max_items=300), SQLiteBackend('/var/cache/memoize.db', max_items=10000)
+    ))
+
+    Lookups are answered by L1, an L1 miss reads through to L2 and copies the item (with its expiry)
+    into L1. Items are written to both tiers. L2 is bigger than L1 (an item evicted from L1 is still
+    on disk) and it survives restarts, so a process which starts with an empty L1 doesn't compute
+    everything again.
+
+    Clears and invalidations go to both tiers. The generation of L2 is shared by all processes using
+    its file, when another process changed it L1 is cleared: it might hold items which were invalidated.
+    """
+
+    def __init__(self, l1, l2):
+        self.l1 = l1
+        self.l2 = l2
+        self.l2_hits = 0
+        self.seen_generation = l2.generation()
+
+    def _sync(self):
+        """ Clear L1 when the L2 generation was changed by another process """
+        generation = self.l2.generation()
+        if generation != self.seen_generation:
+            self.l1.clear()
+            self.seen_generation = generation
+        return generation
+
+    def generation(self):
+        """ Return the generation counter of L2 (see: module) """
+        return self.l2.generation()
+
+    def keys(self):
+        """ Return the keys of L1, the least recently used first """
+        return self.l1.keys()
+
+    def get(self, key):
+        """ Return (HIT or STALE, value) for an item which isn't expired, (MISS or EXPIRED, None) otherwise """
+        self._sync()
+        status, value = self.l1.get(key)
+        if status in (HIT, STALE):
+            return status, value
+
+        # Read through to L2, and keep the item in L1 for the next lookup
+        entry = self.l2.entry(key)
+        if entry is None:
+            return status, None
+        value, tags, expiry, fresh = entry
+        self.l1.restore(key, value, tags, expiry, fresh)
+        self.l2_hits += 1
+        return HIT if time.time() <= fresh else STALE, value
+
+    # pylint: disable=too-many-arguments
+    def set(self, key, value, ttl, tags=None, generation=None, stale_ttl=0):
+        """ Store an item in both tiers, unless the generation changed since it was read. Returns the
+            amount of items evicted from L1
+        """
+        if generation is None:
+            self.l2.set(key, value, ttl, tags=tags, stale_ttl=stale_ttl)
+            return self.l1.set(key, value, ttl, tags=tags, stale_ttl=stale_ttl)
+
+        # An invalidation by this process changes the L1 generation, one by another process the L2 generation
+        l1_generation = self.l1.generation()
+        if generation != self._sync():
+            return 0
+        self.l2.set(key, value, ttl, tags=tags, generation=generation, stale_ttl=stale_ttl)
+
+        # L2 rejected the item when the generation changed in the meantime, don't keep it in L1 either
+        if generation != self._sync():
+            return 0
+        return self.l1.set(key, value, ttl, tags=tags, generation=l1_generation, stale_ttl=stale_ttl)
+
+    def victim(self, key):
+        """ Return the key which is evicted from L1 first when key is stored, None if nothing is evicted """
+        return self.l1.victim(key)
+
+    def delete(self, key):
+        """ Remove an item (if present) from both tiers """
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def _changed(self, change):
+        """ Apply a change to both tiers, and keep track of the L2 generation it increments """
+        generation = self.l2.generation()
+        change(self.l1)
+        change(self.l2)
+
+        # If another process changed the generation as well, L1 is cleared on next use
+        if self.l2.generation() == generation + 1 and generation == self.seen_generation:
+            self.seen_generation = generation + 1
+
+    def clear(self):
+        """ Remove all items from both tiers """
+        self._changed(lambda backend: backend.clear())
+
+    def invalidate(self, match):
+        """ Remove the items for which match(tags) is true, and all items without tags, from both tiers """
+        self._changed(lambda backend: backend.invalidate(match))
+
+    def usage(self):
+        """ Return the usage of L1, with the usage of L2 and the amount of L1 misses it answered """
+        return dict(self.l1.usage(), l2=dict(self.l2.usage(), hits=self.l2_hits))
+
+
+class _Transaction:  # pylint: disable=too-few-public-methods
+    """ Context manager running a write transaction on a connection in autocommit mode """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        # Take the write lock up front, a read followed by a write can't be interleaved by another process
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type is not None else 'COMMIT')
+        return False
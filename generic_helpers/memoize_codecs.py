@@ -0,0 +1,43 @@
+""" Codecs for Memoize: store large values in a compact form
+
+    A memoized search holds a list of serialized tasks, mostly descriptions. Those are stored as
+    Python dicts and strings, which take several times the memory of the same data pickled and
+    compressed. A codec encodes the values above a size threshold when they are stored, and decodes
+    them on every hit: it trades CPU time on hits for memory (see: Memoize, Metrics).
+"""
+import pickle
+import zlib
+from collections import namedtuple
+
+# An encoded value, a tuple so approximate_size (see: memoize_backends.py) counts the data
+Compressed = namedtuple('Compressed', ('data', 'raw_size'))
+
+
+class ZlibCodec:
+    """ Pickle and zlib-compress values of at least threshold bytes (pickled)
+
+    Example usage:
+
+    memoize = Memoize(codec=ZlibCodec(threshold=16384, level=1))
+
+    Values which pickle to less than threshold bytes are stored as is, they are not worth the CPU
+    time. A hit returns a new copy of a decoded value, callers can't change the cached value.
+    """
+
+    def __init__(self, threshold=16384, level=1):
+        self.threshold = threshold
+        self.level = level
+
+    def encode(self, value):
+        """ Return the value to store: a Compressed value, or the value itself when it's small """
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) < self.threshold:
+            return value
+        return Compressed(zlib.compress(data, self.level), len(data))
+
+    @staticmethod
+    def decode(stored):
+        """ Return the value of a stored value """
+        if isinstance(stored, Compressed):
+            return pickle.loads(zlib.decompress(stored.data))
+        return stored
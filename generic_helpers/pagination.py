@@ -1,4 +1,9 @@
 """ Create paginated results """
+import base64
+import bisect
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
 
 
 def set_paginated_response(data, page=1, page_size=20):
@@ -30,3 +35,159 @@ def set_paginated_response(data, page=1, page_size=20):
         'current_page': page,
         'last_page': total_pages
     }
+
+
+def set_paginated_query_response(query, page=1, page_size=20):
+    """ Set paginated result for a (SQLAlchemy) query
+
+        Unlike set_paginated_response the data is not loaded in memory. The database counts the
+        items (COUNT) and only returns the items of the requested page (LIMIT/OFFSET). The query
+        should have an ORDER BY, otherwise the pages are not guaranteed to be stable.
+    """
+
+    # Compute the total amount of pages using page_size and the amount of items per page
+    total_items = query.count()
+    total_pages = (total_items + page_size - 1) // page_size  # Calculate total pages
+
+    # Guard clause. Return an empty list if we're out of bounds
+    if page < 1 or page > total_pages:
+        return {
+            'result': [],
+            'current_page': page,
+            'last_page': total_pages
+        }
+
+    # Compute the start index, the database returns the items of this page only
+    start_index = (page - 1) * page_size
+    paginated_items = query.limit(page_size).offset(start_index).all()
+
+    # Return the result alongside useful information to retrieve the next or former page
+    return {
+        'result': paginated_items,
+        'current_page': page,
+        'last_page': total_pages
+    }
+
+
+def datetime_sort_value(value):
+    """ Integer (microseconds) sort value of a datetime, negate it to sort in descending order """
+    return (value - datetime.min) // timedelta(microseconds=1)
+
+
+def sort_value_datetime(value):
+    """ The datetime of a sort value (see: datetime_sort_value) """
+    return datetime.min + timedelta(microseconds=value)
+
+
+def encode_cursor(values):
+    """ Encode the sort key values of the last item on a page into an opaque cursor
+
+        datetime values are encoded as isoformat strings
+    """
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, types):
+    """ Decode an opaque cursor into a tuple of sort key values of the given types
+
+        An empty cursor (the first page) is decoded as None. A ValueError is raised
+        for a cursor which can't be decoded, or which holds a datetime with a timezone: the
+        due_dates are naive, they can't be compared.
+    """
+    if not cursor:
+        return None
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if len(values) != len(types):
+            raise ValueError('Invalid cursor')
+        key = tuple(
+            datetime.fromisoformat(value) if value_type is datetime else value_type(value)
+            for value, value_type in zip(values, types)
+        )
+        if any(isinstance(value, datetime) and value.tzinfo is not None for value in key):
+            raise ValueError('Invalid cursor')
+        return key
+    # Note: binascii.Error, JSONDecodeError and UnicodeError are all ValueErrors
+    except (TypeError, ValueError) as exc:
+        # We raise a Value error, so we can catch it in the calling method
+        raise ValueError('Invalid cursor') from exc
+
+
+def is_descending(position, count, descending):
+    """ True if the sort key value at position (of count values) is sorted in descending order
+
+        The last value is the unique tie-breaker (e.g. id), it's always ascending. Just like the
+        ORDER BY due_date DESC, id of the pages by offset, so both modes order ties the same.
+    """
+    return descending and position < count - 1
+
+
+def set_keyset_query_response(query, columns, cursor=None, page_size=20, descending=False):
+    """ Set keyset (cursor) paginated result for a (SQLAlchemy) query
+
+        The items are ordered on the columns (e.g. (Task.due_date, Task.id), the last column should be
+        unique). Instead of skipping the items of all former pages (OFFSET), the database seeks to the
+        first item after the cursor, so the cost of a page doesn't grow with the page depth.
+    """
+    directions = [is_descending(position, len(columns), descending) for position in range(len(columns))]
+
+    # Seek to the items after the cursor: (a, b) > (x, y) is a > x OR (a = x AND b > y)
+    key = decode_cursor(cursor, [column.type.python_type for column in columns])
+    if key is not None:
+        seek = []
+        for position, column in enumerate(columns):
+            equal = [columns[i] == key[i] for i in range(position)]
+            after = column < key[position] if directions[position] else column > key[position]
+            seek.append(and_(*equal, after))
+        query = query.filter(or_(*seek))
+
+    # Fetch one item more than the page_size, to find out if there is a next page
+    order = [column.desc() if desc else column.asc() for column, desc in zip(columns, directions)]
+    items = query.order_by(*order).limit(page_size + 1).all()
+
+    return {
+        'result': items[:page_size],
+        'next_cursor': (
+            encode_cursor([getattr(items[page_size - 1], column.key) for column in columns])
+            if len(items) > page_size > 0 else None
+        )
+    }
+
+
+def set_keyset_sorted_response(ids, sort_values, cursor=None, page_size=20, descending=False):
+    """ Set keyset (cursor) paginated result for ids which are already in memory, e.g. a memoized search
+
+        The ids are ordered on a datetime (e.g. due_date), sort_values holds the ascending sort value of
+        every id: datetime_sort_value, negated when descending. The pages are ordered on (datetime, id)
+        just like set_keyset_query_response, ids with the same datetime are ordered on id. The first id
+        after the cursor is found by bisecting the sort values, so the cost of a page doesn't grow with
+        the page depth or with the amount of ids.
+    """
+    key = decode_cursor(cursor, (datetime, int))
+    position = 0
+    if key is not None:
+        cursor_value = -datetime_sort_value(key[0]) if descending else datetime_sort_value(key[0])
+        position = bisect.bisect_left(sort_values, cursor_value)
+
+    # Collect one item more than the page_size (to find out if there is a next page), one block of ids
+    # with the same sort value at a time. The block of the cursor only holds the ids after it
+    items = []
+    while position < len(ids) and len(items) <= page_size:
+        value = sort_values[position]
+        end = bisect.bisect_right(sort_values, value, lo=position)
+        block = sorted(ids[position:end])
+        if key is not None and value == cursor_value:
+            block = [item_id for item_id in block if item_id > key[1]]
+        items.extend((value, item_id) for item_id in block)
+        position = end
+
+    next_cursor = None
+    if len(items) > page_size > 0:
+        value, item_id = items[page_size - 1]
+        next_cursor = encode_cursor((sort_value_datetime(-value if descending else value), item_id))
+    return {
+        'result': [item_id for _, item_id in items[:page_size]],
+        'next_cursor': next_cursor,
+    }
@@ -0,0 +1,243 @@
+""" Levenshtein search over title shards in shared memory, scored by a pool of processes
+
+    Scoring in threads doesn't use more than one core for code which holds the GIL, and one heavy
+    search stalls every other request handled by the same process. The ShardedTitleArray splits the
+    normalized titles in shards, publishes each shard in a block of shared memory (see:
+    multiprocessing.shared_memory) and lets a pool of worker processes score a query against all
+    shards at once. The workers only receive the name of a block and the query, not the titles.
+
+    Layout of a shard block (all integers are unsigned 64 bit, little endian):
+
+    [count][offset 0][offset 1]...[offset count][utf-8 encoded titles, back to back]
+
+    Title i is block[offset i:offset i + 1] of the titles part.
+
+    Every shard has its own block. A write only marks the shard(s) holding the changed positions
+    stale, the next search republishes just those.
+"""
+import atexit
+import struct
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+from generic_helpers.title_array import TitleArray
+from generic_helpers.trigram_index import normalize
+
+# Below this amount of titles the search is done in-process, the fan-out costs more than it saves
+MIN_PARALLEL_SIZE = 20000
+
+# Arrays which are closed at exit (registered once, instead of once per array)
+_arrays = weakref.WeakSet()
+
+# Shards attached by a worker process, by block name (only used inside the worker processes)
+_attached_shards = {}
+MAX_ATTACHED_SHARDS = 64
+
+
+def encode_shard(values):
+    """ Encode a list of strings into the bytes of a shard block """
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return struct.pack(f'<Q{len(offsets)}Q', len(encoded), *offsets) + b''.join(encoded)
+
+
+def decode_shard(buffer):
+    """ Decode the bytes of a shard block into a list of strings """
+    (count,) = struct.unpack_from('<Q', buffer, 0)
+    offsets = struct.unpack_from(f'<{count + 1}Q', buffer, 8)
+    start = 8 * (count + 2)
+    return [
+        bytes(buffer[start + offsets[i]:start + offsets[i + 1]]).decode('utf-8') for i in range(count)
+    ]
+
+
+def search_shard(name, query, max_distance):
+    """ Worker process: score the query against the shard in block 'name'
+
+        Returns a list of (position in shard, distance) tuples within max_distance. The decoded shard
+        is kept by the worker, the next query for the same shard doesn't decode it again.
+    """
+    values = _attached_shards.get(name)
+    if values is None:
+        if len(_attached_shards) >= MAX_ATTACHED_SHARDS:
+            _attached_shards.clear()
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            values = decode_shard(block.buf)
+        finally:
+            block.close()
+        _attached_shards[name] = values
+
+    matches = process.extract(
+        query, values, scorer=Levenshtein.distance, score_cutoff=max_distance, limit=None
+    )
+    return [(position, score) for _, score, position in matches]
+
+
+class PublishedShard:  # pylint: disable=too-few-public-methods
+    """ A shard block, with a snapshot of the keys and values it holds """
+
+    def __init__(self, keys, values):
+        self.users = 0
+        self.retired = False
+        self.keys = keys
+        self.values = values
+        data = encode_shard(values)
+        self.block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        self.block.buf[:len(data)] = data
+        self.name = self.block.name
+
+    def retire(self):
+        """ Mark the shard replaced, free its shared memory once no search is using it """
+        self.retired = True
+        if self.users == 0:
+            self.close()
+
+    def close(self):
+        """ Free the shared memory of this shard """
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+class ShardedTitleArray(TitleArray):
+    """ Title array which scores large searches in a pool of worker processes
+
+    Example usage:
+
+    array = ShardedTitleArray(workers=8)
+    array.add(1, 'Task 1')
+    array.search('task 2', max_distance=1)  # -> [(1, 'task 1', 1)]
+
+    Writes only mark the shards holding the changed positions stale, the next search republishes
+    those. A shard is freed when it's replaced and no search is using it anymore. When the array
+    grew (or shrunk) a lot, all shards are published again with a new shard size.
+    """
+
+    def __init__(self, workers=1):
+        super().__init__()
+        self.processes = max(1, workers)
+        self.pool = None
+        self.shards = None
+        self.shard_size = None
+        self.stale_shards = set()
+        _arrays.add(self)
+
+    def _mark_stale(self, *positions):
+        """ Mark the shards holding the positions stale """
+        if self.shard_size is not None:
+            self.stale_shards.update(position // self.shard_size for position in positions)
+
+    def add(self, key, value):
+        with self.lock:
+            super().add(key, value)
+            self._mark_stale(self.positions[key])
+
+    def remove(self, key):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                return
+            last_position = len(self.values) - 1
+            super().remove(key)
+
+            # The last value moved into the free position
+            self._mark_stale(position, last_position)
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+            self._retire_shards()
+
+    def _retire_shards(self):
+        """ Retire all shards, the next search publishes them again """
+        for shard in self.shards or []:
+            shard.retire()
+        self.shards = None
+        self.shard_size = None
+        self.stale_shards = set()
+
+    def close(self):
+        """ Stop the worker processes and free the shared memory """
+        with self.lock:
+            self._retire_shards()
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+
+    def _publish(self, index):
+        """ Publish the shard at index """
+        start = index * self.shard_size
+        return PublishedShard(self.keys[start:start + self.shard_size], self.values[start:start + self.shard_size])
+
+    def _acquire_shards(self):
+        """ Return the current shards (republish the stale ones) and mark them in use """
+        with self.lock:
+            count = -(-len(self.values) // self.shard_size) if self.shard_size else 0
+
+            # Publish all shards: the first time, or when the amount of shards drifted too far from the
+            # amount of processes
+            if self.shards is None or not self.processes <= count <= 2 * self.processes:
+                self._retire_shards()
+                self.shard_size = max(1, -(-len(self.values) // self.processes))
+                count = -(-len(self.values) // self.shard_size)
+                self.shards = [self._publish(index) for index in range(count)]
+            elif self.stale_shards or count != len(self.shards):
+                for index in self.stale_shards | set(range(count, len(self.shards))):
+                    if index < len(self.shards):
+                        self.shards[index].retire()
+                self.shards = [
+                    self._publish(index)
+                    if index in self.stale_shards or index >= len(self.shards) else self.shards[index]
+                    for index in range(count)
+                ]
+            self.stale_shards = set()
+
+            if self.pool is None:
+                # Spawn (instead of fork) the workers, forking a process running threads isn't safe
+                self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=get_context('spawn'))
+            shards = list(self.shards)
+            for shard in shards:
+                shard.users += 1
+            return shards, self.pool
+
+    def _release_shards(self, shards):
+        """ Mark shards no longer in use, free the ones which have been replaced """
+        with self.lock:
+            for shard in shards:
+                shard.users -= 1
+                if shard.retired and shard.users == 0:
+                    shard.close()
+
+    def search(self, query, max_distance):
+        """ Return a list of (key, normalized value, distance) tuples within max_distance of the query """
+        if len(self) < MIN_PARALLEL_SIZE or self.processes == 1:
+            return super().search(query, max_distance)
+
+        normalized_query = normalize(query)
+        shards, pool = self._acquire_shards()
+        try:
+            # Fan out to all shards, and merge the partial results
+            futures = [
+                (pool.submit(search_shard, shard.name, normalized_query, max_distance), shard)
+                for shard in shards
+            ]
+            return [
+                (shard.keys[position], shard.values[position], score)
+                for future, shard in futures
+                for position, score in future.result()
+            ]
+        finally:
+            self._release_shards(shards)
+
+
+@atexit.register
+def close_arrays():
+    """ Stop the worker processes and free the shared memory of all arrays """
+    for array in list(_arrays):
+        array.close()
@@ -0,0 +1,83 @@
+""" Sorted array of values for prefix (autocomplete) lookups
+
+    The distinct normalized values are kept in a sorted list. All values starting with a prefix are
+    adjacent in that list, bisect finds the first one in O(log n), the completions are the values
+    which follow. The keys holding a normalized value are kept next to it, many tasks named 'Task 1'
+    take one entry, so a completion doesn't walk past duplicates.
+"""
+import bisect
+import threading
+from generic_helpers.trigram_index import normalize
+
+
+class PrefixIndex:
+    """ Sorted array of distinct normalized values, and the keys holding them
+
+    Example usage:
+
+    index = PrefixIndex()
+    index.add(1, 'Task 1')
+    index.add(2, 'Task 2')
+    index.add(3, 'Groceries')
+    index.complete('ta', limit=10)  # -> ['Task 1', 'Task 2']
+
+    The index is safe to use from multiple (wsgiserver) threads.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
+        self.values = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, key, value):
+        """ Add (or replace) the value stored under key, the value cannot be None """
+        if value is None:
+            raise ValueError('value cannot be None')
+        normalized = normalize(value)
+        with self.lock:
+            self.remove(key)
+            self.values[key] = value
+
+            # The keys of a normalized value in order of addition, the first one is suggested
+            keys = self.keys.get(normalized)
+            if keys is None:
+                keys = self.keys[normalized] = {}
+                bisect.insort(self.entries, normalized)
+            keys[key] = None
+
+    def remove(self, key):
+        """ Remove a key from the index, silently ignore unknown keys """
+        with self.lock:
+            if key not in self.values:
+                return
+            normalized = normalize(self.values.pop(key))
+            keys = self.keys[normalized]
+            del keys[key]
+            if not keys:
+                del self.keys[normalized]
+                del self.entries[bisect.bisect_left(self.entries, normalized)]
+
+    def clear(self):
+        """ Remove everything from the index """
+        with self.lock:
+            self.entries = []
+            self.keys = {}
+            self.values = {}
+
+    def complete(self, prefix, limit=10):
+        """ Return (at most) limit distinct values starting with prefix (case-insensitive), in order """
+        normalized_prefix = normalize(prefix)
+        completions = []
+        with self.lock:
+            position = bisect.bisect_left(self.entries, normalized_prefix)
+            while position < len(self.entries) and len(completions) < limit:
+                normalized = self.entries[position]
+                if not normalized.startswith(normalized_prefix):
+                    break
+                completions.append(self.values[next(iter(self.keys[normalized]))])
+                position += 1
+        return completions
@@ -0,0 +1,159 @@
+""" Serialized rows shared by all memoized results which reference them
+
+    A memoized page or search used to hold its own copy of every serialized task, a task found by 50
+    cached searches was stored 50 times. Now the memoized results only hold the ids of their tasks,
+    which are resolved against this store when the response is built. Every row is serialized and
+    stored once, so the memory scales with the amount of tasks rather than with tasks times cached
+    results. Rows which are not in the store (yet) are loaded from the database in one go.
+
+    A row is valid for an id and a version of the store:
+
+    - A writer discards the row of the item it changed, which increments the version.
+    - A row loaded while the version changed (e.g. by a concurrent write) is returned, but not stored.
+    - With a generation callable (e.g. the generation of the memoization backend, see:
+      memoize_backends.py) the store is cleared when another process invalidated memoized results,
+      the items it changed are unknown.
+    - A row expires ttl seconds after it was loaded (by default the ttl of the memoized results).
+      With a backend per process the writes of other processes are not seen, a row is at most ttl
+      seconds out of date then, just like a memoized result.
+
+    Next to a row the store keeps its JSON encoding (see: json_fragments.py), it's encoded on first
+    use and dropped together with the row.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from generic_helpers.json_fragments import encode_json
+
+MAX_ITEMS = 100000
+TTL = 300
+
+# A stored row, its JSON encoding (None until it's used) and the time it expires
+StoredRow = namedtuple('StoredRow', ('row', 'encoded', 'expiry'))
+
+
+class RowStore:
+    """ Rows by id, the least recently used row first
+
+    Example usage:
+
+    rows = RowStore(lambda ids: {task.id: task.serialize() for task in iter_by_ids(Task, ids)})
+    rows.get_rows([3, 1, 2])  # -> [{'id': 3, ...}, {'id': 1, ...}, {'id': 2, ...}]
+    rows.get_encoded([3, 1])  # -> [b'{"id":3,...}', b'{"id":1,...}']
+    rows.discard(1)  # after task 1 has been updated or deleted
+
+    The rows are shared by all callers, they should not be changed. The store is safe to use from
+    multiple (wsgiserver) threads.
+    """
+
+    def __init__(self, load, generation=None, max_items=MAX_ITEMS, ttl=TTL):
+        self.load = load
+        self.generation = generation
+        self.max_items = max_items
+        self.ttl = ttl
+        self.rows = OrderedDict()
+        self.lock = threading.RLock()
+
+        # The version of the store, the generation it's in sync with and the usage counters
+        self.state = {
+            'version': 0,
+            'generation': generation() if generation is not None else None,
+            'hits': 0,
+            'loads': 0,
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _sync(self):
+        """ Clear the rows when the generation was changed by another process, returns the generation """
+        if self.generation is None:
+            return None
+        generation = self.generation()
+        if generation != self.state['generation']:
+            self.rows.clear()
+            self.state['generation'] = generation
+        return generation
+
+    def _lookup(self, ids):
+        """ Return a dict id -> stored row of the ids, load the rows which are not stored (or expired) """
+        stored = {}
+        with self.lock:
+            generation = self._sync()
+            version = self.state['version']
+            now = time.time()
+            for item_id in ids:
+                entry = self.rows.get(item_id)
+                if entry is None:
+                    continue
+                if now > entry.expiry:
+                    del self.rows[item_id]
+                    continue
+                self.rows.move_to_end(item_id)
+                stored[item_id] = entry
+            self.state['hits'] += len(stored)
+        missing = [item_id for item_id in ids if item_id not in stored]
+
+        # Load the missing rows outside the lock, store them unless an item changed in the meantime
+        if missing:
+            expiry = time.time() + self.ttl
+            loaded = {item_id: StoredRow(row, None, expiry) for item_id, row in self.load(missing).items()}
+            with self.lock:
+                self.state['loads'] += len(loaded)
+                if self.state['version'] == version and self._sync() == generation:
+                    self.rows.update(loaded)
+                    while len(self.rows) > self.max_items:
+                        self.rows.popitem(last=False)
+            stored.update(loaded)
+        return stored
+
+    def get_rows(self, ids):
+        """ Return the rows of the ids, in order of the ids. Ids which don't exist (anymore) are left out """
+        ids = list(ids)
+        stored = self._lookup(ids)
+        return [stored[item_id].row for item_id in ids if item_id in stored]
+
+    def get_encoded(self, ids):
+        """ Return the encoded rows of the ids, in order of the ids. Ids which don't exist (anymore) are left out """
+        ids = list(ids)
+        stored = self._lookup(ids)
+
+        # Encode the missing ones outside the lock, only keep the encoding of a row which is still stored
+        encoded = {}
+        for item_id, entry in stored.items():
+            encoded[item_id] = entry.encoded
+            if entry.encoded is None:
+                encoded[item_id] = encode_json(entry.row)
+                with self.lock:
+                    if self.rows.get(item_id) is entry:
+                        self.rows[item_id] = entry._replace(encoded=encoded[item_id])
+        return [encoded[item_id] for item_id in ids if item_id in encoded]
+
+    def discard(self, item_id):
+        """ Remove the row of an item (after it has been changed or deleted) """
+        with self.lock:
+            self.rows.pop(item_id, None)
+            self.state['version'] += 1
+
+            # Call this after the memoized results were invalidated. When that was the only change of the
+            # generation, it doesn't need to clear the store
+            if self.generation is not None:
+                generation = self.generation()
+                if generation == self.state['generation'] + 1:
+                    self.state['generation'] = generation
+
+    def clear(self):
+        """ Remove all rows """
+        with self.lock:
+            self.rows.clear()
+            self.state['version'] += 1
+
+    def usage(self):
+        """ Return the amount of rows, and the amount of rows served from the store and loaded """
+        with self.lock:
+            return {
+                'items': len(self.rows),
+                'max_items': self.max_items,
+                'hits': self.state['hits'],
+                'loads': self.state['loads'],
+            }
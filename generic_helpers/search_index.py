@@ -0,0 +1,227 @@
+""" In-memory search index of a model, kept up to date by the writers
+
+    The search index holds a record for every item: the searchable field and a few attributes which
+    are used for filtering and sorting (e.g. status and due_date of a task). It is built from the
+    database once (on first use, or at startup), after that the writers apply their changes to it:
+
+    search_index.apply(task)  # after a task is created or updated
+    search_index.discard(task_id)  # after a task is deleted
+
+    On top of the records it maintains the indexes of the levenshtein search strategies (see:
+    levenshtein.py) and the prefix index for autocompletion (see: prefix_index.py), so a search
+    right after a write runs against warm state instead of rebuilding.
+
+    The writers of other processes don't apply their changes to this index. Before every use it reads
+    the changes after the last one it has seen from the change log (see: change_log.py), reloads only
+    those items and applies them to the records and indexes. Otherwise a process with a stale index
+    would compute results which miss the writes of the others, and store them in the shared cache. Its
+    own changes are in the log as well, those records are already up to date and are skipped. Only when
+    it fell behind more than the log holds, all records are loaded again.
+"""
+import threading
+from generic_helpers.change_log import create_change_log, read_last_change, read_changes
+from generic_helpers.trigram_index import TrigramIndex
+from generic_helpers.bk_tree import BKTree
+from generic_helpers.title_array import TitleArray
+from generic_helpers.parallel_search import ShardedTitleArray
+from generic_helpers.prefix_index import PrefixIndex
+
+# Index classes by search strategy (the 'scan' strategy doesn't use an index), and
+# the 'prefix' index for autocompletion
+INDEX_CLASSES = {
+    'trigram': TrigramIndex,
+    'bktree': BKTree,
+    'batch': TitleArray,
+    'parallel': ShardedTitleArray,
+    'prefix': PrefixIndex,
+}
+
+# SQLite refuses statements with too many bound parameters, reload changed items in chunks
+RELOAD_CHUNK_SIZE = 500
+
+# Search indexes by (table name, field name)
+_search_indexes = {}
+_search_indexes_lock = threading.Lock()
+
+
+class SearchIndex:
+    """ Records (field and attributes) of all items of a model, and the strategy indexes on the field
+
+    Example usage:
+
+    search_index = register_search_index(SearchIndex(Task, 'title', attributes=('status', 'due_date')))
+    search_index.get_index('trigram').search_substring('task')
+    search_index.get_records([1, 2])  # -> {1: {'title': ..., 'status': ..., 'due_date': ...}, 2: ...}
+
+    The index is safe to use from multiple (wsgiserver) threads.
+    """
+
+    def __init__(self, model, field_name, attributes=()):
+        self.model = model
+        # The field first, followed by the attributes
+        self.fields = (field_name,) + tuple(attributes)
+        self.last_change = None
+        self.records = None
+        self.indexes = {}
+        self.lock = threading.RLock()
+
+    @property
+    def field_name(self):
+        """ The name of the searchable field """
+        return self.fields[0]
+
+    def _record(self, values):
+        """ Build a record from the values of the field and the attributes """
+        return dict(zip(self.fields, values))
+
+    def _load(self, ids=None):
+        """ Load the records of the ids (all of them when None) from the database, returns a dict id -> record """
+
+        # Only fetch the id, the field and the attributes, there is no need to hydrate ORM objects
+        columns = [getattr(self.model, name) for name in self.fields]
+        query = self.model.query.with_entities(self.model.id, *columns)
+        if ids is None:
+            return {row[0]: self._record(row[1:]) for row in query}
+        return {
+            row[0]: self._record(row[1:])
+            for start in range(0, len(ids), RELOAD_CHUNK_SIZE)
+            for row in query.filter(self.model.id.in_(ids[start:start + RELOAD_CHUNK_SIZE]))
+        }
+
+    @staticmethod
+    def _add_to_index(index, key, value):
+        """ Add (or replace) a value in an index, an item without a value (None) is left out """
+        if value is None:
+            index.remove(key)
+        else:
+            index.add(key, value)
+
+    def _ensure_built(self):
+        """ Load the records from the database if that didn't happen yet, otherwise apply the changes since """
+        if self.records is None:
+            self._reload()
+        else:
+            self._sync()
+
+    def _reload(self):
+        """ Load all records from the database, and refill the indexes (they keep e.g. their worker processes) """
+        create_change_log(self.model)
+
+        # Read the last change before loading, a change committed in between is applied again on next use
+        self.last_change = read_last_change(self.model)
+        self.records = self._load()
+        for index in self.indexes.values():
+            index.clear()
+            for item_id, record in self.records.items():
+                self._add_to_index(index, item_id, record[self.field_name])
+
+    def _sync(self):
+        """ Apply the changes logged after the last one seen (by any process) to the records and indexes """
+        changes = read_changes(self.model, self.last_change)
+        if not changes:
+            return
+
+        # The log was trimmed past the last change seen, the changes in between are unknown
+        if changes[0][0] != self.last_change + 1:
+            self._reload()
+            return
+
+        ids = list({item_id for _, item_id in changes})
+        records = self._load(ids)
+        for item_id in ids:
+            record = records.get(item_id)
+            if record == self.records.get(item_id):
+                # Unchanged, or already applied by a writer of this process
+                continue
+            if record is None:
+                self._discard(item_id)
+            else:
+                self._apply(item_id, record)
+        self.last_change = changes[-1][0]
+
+    def build(self):
+        """ Build the records (e.g. at startup), instead of on first use """
+        with self.lock:
+            self._ensure_built()
+
+    def get_index(self, strategy, **options):
+        """ Return the index of a search strategy, build it from the records on first use
+
+            The options (e.g. workers=4 for the 'parallel' strategy) are passed to the index when it's built
+        """
+        with self.lock:
+            self._ensure_built()
+            index = self.indexes.get(strategy)
+            if index is None:
+                index = INDEX_CLASSES[strategy](**options)
+                for item_id, record in self.records.items():
+                    self._add_to_index(index, item_id, record[self.field_name])
+                self.indexes[strategy] = index
+            return index
+
+    def get_records(self, ids):
+        """ Return a dict id -> record for the ids (unknown ids are left out) """
+        with self.lock:
+            self._ensure_built()
+            return {item_id: self.records[item_id] for item_id in ids if item_id in self.records}
+
+    def _apply(self, item_id, record):
+        """ Add or replace the record of an item in the records and indexes """
+        self.records[item_id] = record
+        for index in self.indexes.values():
+            self._add_to_index(index, item_id, record[self.field_name])
+
+    def _discard(self, item_id):
+        """ Remove an item from the records and indexes """
+        self.records.pop(item_id, None)
+        for index in self.indexes.values():
+            index.remove(item_id)
+
+    def apply(self, item):
+        """ Add or replace an item (after it has been committed to the database) """
+        with self.lock:
+            # Not built yet, it will be loaded from the database (including this item) on first use
+            if self.records is None:
+                return
+            self._apply(item.id, self._record([getattr(item, name) for name in self.fields]))
+
+    def discard(self, item_id):
+        """ Remove an item (after it has been deleted from the database) """
+        with self.lock:
+            if self.records is None:
+                return
+            self._discard(item_id)
+
+    def reset(self):
+        """ Drop the records and close the indexes (e.g. for another database), they will be rebuilt on next use """
+        with self.lock:
+            for index in self.indexes.values():
+                if hasattr(index, 'close'):
+                    index.close()
+            self.records = None
+            self.indexes = {}
+
+
+def register_search_index(search_index):
+    """ Register the search index of a model's field, returns the search index """
+    with _search_indexes_lock:
+        _search_indexes[(search_index.model.__tablename__, search_index.field_name)] = search_index
+    return search_index
+
+
+def get_search_index(model, field_name):
+    """ Return the search index of model.field_name, register one (without attributes) if there is none """
+    with _search_indexes_lock:
+        search_index = _search_indexes.get((model.__tablename__, field_name))
+        if search_index is None:
+            search_index = SearchIndex(model, field_name)
+            _search_indexes[(model.__tablename__, field_name)] = search_index
+        return search_index
+
+
+def reset_search_indexes():
+    """ Reset all search indexes, they will be rebuilt on next use """
+    with _search_indexes_lock:
+        search_indexes = list(_search_indexes.values())
+    for search_index in search_indexes:
+        search_index.reset()
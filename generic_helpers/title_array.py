@@ -0,0 +1,94 @@
+""" Pre-normalized array of values for batched levenshtein scoring
+
+    Scoring a query against values one pair at a time from Python costs a function call, two lower()
+    calls and the loop overhead for every value. This array holds the normalized values in a plain list,
+    so rapidfuzz can score the query against all of them in one native call. The score_cutoff lets it
+    stop computing a distance as soon as it exceeds the maximum distance.
+
+    The scoring runs in the calling thread: splitting it over threads doesn't make it faster, the
+    GIL is held while rapidfuzz walks the list (see: parallel_search.py for scoring on more cores).
+
+    see: https://rapidfuzz.github.io/RapidFuzz/Usage/process.html#extract
+"""
+import threading
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+from generic_helpers.trigram_index import normalize
+
+
+class TitleArray:
+    """ Array of normalized values with their keys
+
+    Example usage:
+
+    array = TitleArray()
+    array.add(1, 'Task 1')
+    array.add(2, 'Groceries')
+    array.search('task 2', max_distance=1)  # -> [(1, 'task 1', 1)]
+
+    Removing a key moves the last value into its slot, so keys and values stay dense lists.
+    The array is safe to use from multiple (wsgiserver) threads, a search scores a snapshot of the
+    values without holding the lock.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+        self.positions = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, key, value):
+        """ Add (or replace) the value stored under key """
+        normalized = normalize(value)
+        with self.lock:
+            position = self.positions.get(key)
+            if position is not None:
+                self.values[position] = normalized
+                return
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            self.values.append(normalized)
+
+    def remove(self, key):
+        """ Remove a key from the array, silently ignore unknown keys """
+        with self.lock:
+            position = self.positions.pop(key, None)
+            if position is None:
+                return
+
+            # Move the last item into the free slot
+            last_key = self.keys.pop()
+            last_value = self.values.pop()
+            if last_key != key:
+                self.keys[position] = last_key
+                self.values[position] = last_value
+                self.positions[last_key] = position
+
+    def clear(self):
+        """ Remove everything from the array """
+        with self.lock:
+            self.keys = []
+            self.values = []
+            self.positions = {}
+
+    def search(self, query, max_distance):
+        """ Return a list of (key, normalized value, distance) tuples within max_distance of the query """
+        normalized_query = normalize(query)
+
+        # Copying the lists is cheap compared to scoring them, writers don't wait for the scoring
+        with self.lock:
+            keys = list(self.keys)
+            values = list(self.values)
+
+        # Score in one native call
+        matches = process.extract(
+            normalized_query,
+            values,
+            scorer=Levenshtein.distance,
+            score_cutoff=max_distance,
+            limit=None,
+        )
+        return [(keys[index], value, score) for value, score, index in matches]
@@ -0,0 +1,106 @@
+""" Trigram inverted index for (case-insensitive) substring lookups
+
+    A trigram is every run of three adjacent characters in a string, e.g. 'task' holds the trigrams
+    'tas' and 'ask'. If a query string is a substring of a value, every trigram of the query is also a
+    trigram of that value. The index maps each trigram to the set of keys holding it, so intersecting
+    the posting sets of the query trigrams yields a (small) set of candidates which is then verified.
+"""
+import threading
+from collections import defaultdict
+
+TRIGRAM_LENGTH = 3
+
+
+def normalize(value):
+    """ Normalize a value for case-insensitive matching """
+    return value.lower() if value is not None else ''
+
+
+def trigrams(value):
+    """ Return the set of trigrams of an (already normalized) value """
+    return {value[i:i + TRIGRAM_LENGTH] for i in range(len(value) - TRIGRAM_LENGTH + 1)}
+
+
+class TrigramIndex:
+    """ Inverted index from trigram to keys
+
+    Example usage:
+
+    index = TrigramIndex()
+    index.add(1, 'Task 1')
+    index.add(2, 'Task 2')
+    index.search_substring('k 2')  # -> [(2, 'task 2')]
+
+    The index is safe to use from multiple (wsgiserver) threads.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.values = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, key, value):
+        """ Add (or replace) the value stored under key """
+        normalized = normalize(value)
+        with self.lock:
+            # Replacing a value means its old trigrams should no longer point to this key
+            self.remove(key)
+            self.values[key] = normalized
+            for trigram in trigrams(normalized):
+                self.postings[trigram].add(key)
+
+    def remove(self, key):
+        """ Remove a key from the index, silently ignore unknown keys """
+        with self.lock:
+            normalized = self.values.pop(key, None)
+            if normalized is None:
+                return
+            for trigram in trigrams(normalized):
+                keys = self.postings.get(trigram)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                # Don't keep empty posting sets around, they only cost memory
+                if not keys:
+                    del self.postings[trigram]
+
+    def clear(self):
+        """ Remove everything from the index """
+        with self.lock:
+            self.postings = defaultdict(set)
+            self.values = {}
+
+    def candidates(self, query):
+        """ Return the keys which contain every trigram of the query
+
+            Queries shorter than a trigram can't be answered by the index, an empty set is returned
+        """
+        query_trigrams = trigrams(normalize(query))
+        if not query_trigrams:
+            return set()
+
+        with self.lock:
+            # Intersect the smallest posting sets first, this keeps the intermediate sets small
+            posting_sets = sorted(
+                (self.postings.get(trigram, set()) for trigram in query_trigrams), key=len
+            )
+            result = set(posting_sets[0])
+            for posting_set in posting_sets[1:]:
+                if not result:
+                    break
+                result &= posting_set
+            return result
+
+    def search_substring(self, query):
+        """ Return a list of (key, normalized value) tuples where the query is a substring of value """
+        normalized_query = normalize(query)
+        with self.lock:
+            # Having all trigrams doesn't guarantee the trigrams are adjacent, so verify each candidate
+            return [
+                (key, self.values[key])
+                for key in self.candidates(normalized_query)
+                if normalized_query in self.values[key]
+            ]
@@ -15,6 +15,10 @@ from routes.api_crud_task import (
 )  # pylint: disable=wrong-import-position
 from routes.api_search_task import (
     api_search_task,
+    api_suggest_task,
+)  # pylint: disable=wrong-import-position
+from routes.api_admin import (
+    api_admin_cache,
 )  # pylint: disable=wrong-import-position
 
 # Auth
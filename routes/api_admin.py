@@ -0,0 +1,23 @@
+""" Admin routes: introspection of the application's caches """
+from http import HTTPStatus
+from flask import make_response, jsonify
+from flasgger import swag_from
+from routes import api
+from generic_helpers.authenticator import authenticated
+from flask_application import memoize  # , authorize
+from apidocs.api_admin import APIAdmin
+
+apidocs = APIAdmin()
+
+
+@api.route("/api/admin/cache", methods=["GET"])
+@swag_from(apidocs.api_cache_stats)
+@authenticated
+# @authorize.read
+def api_admin_cache():
+    """Metrics of the memoization cache, per instance and per memoized function"""
+
+    # Users have no roles (yet), like the other endpoints this one only requires authentication
+    response = make_response(jsonify(memoize.stats()))
+    response.status_code = HTTPStatus.OK
+    return response
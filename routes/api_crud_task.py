@@ -7,14 +7,29 @@ from werkzeug.exceptions import InternalServerError
 from routes import api
 from models import Task
 from database import db
-from flask_application import memoize  # , authorize
-from generic_helpers.pagination import set_paginated_response
+from flask_application import (
+    memoize,
+    search_index,
+    memoize_context,
+    task_rows,
+    MEMOIZE_STALE_TTL,
+)  # , authorize
+from generic_helpers.pagination import (
+    set_paginated_query_response,
+    set_keyset_query_response,
+)
 from generic_helpers.authenticator import authenticated
+from generic_helpers.cache_key import build_cache_key
+from generic_helpers.cache_tags import snapshot, tag_ids, affected_by
+from generic_helpers.json_fragments import json_fragments_response
 from apidocs.api_task_crud import APITaskCRUD
 
 
 apidocs = APITaskCRUD()
 
+# Fields of a task the memoized pages and searches depend on (see: cache_tags.py)
+CACHED_FIELDS = ("title", "description", "status", "due_date")
+
 
 def response_method_not_allowed():
     """Generic response"""
@@ -119,31 +134,35 @@ class APITask(Resource):
 def api_crud_task_get_all():
     """Logic for handling GET request without task_id"""
 
-    @memoize  # key is user token
-    def get_all(memoize_key):  # pylint: disable=unused-argument
+    # key is page and page_size (see: build_cache_key), a page is tagged with the ids of its tasks.
+    # An expired page is refreshed in the background, instead of by a request
+    @memoize(
+        tags=lambda result, *args: tag_ids(result["result"]),
+        stale_ttl=MEMOIZE_STALE_TTL,
+        context=memoize_context,
+    )
+    def get_page(cache_key, page, page_size):  # pylint: disable=unused-argument
         """Because we use memoization, this logic is in its own method
         to be wrapped by the memoize decorator
         """
 
-        # Get all tasks from database
-        tasks = Task.query.all()
-
-        # Convert tasks to a list of dictionaries and return result
-        return [task.serialize() for task in tasks]
+        # Let the database order the tasks, count them and only return the ids of this page.
+        # The serialized tasks are looked up in the row store (see: RowStore)
+        paginated_response = set_paginated_query_response(
+            Task.query.with_entities(Task.id).order_by(Task.id),
+            page=page,
+            page_size=page_size,
+        )
+        paginated_response["result"] = [
+            task_id for (task_id,) in paginated_response["result"]
+        ]
+        return paginated_response
 
-    # Get pagination parameters
+    # Get pagination parameters. When a cursor is given (empty for the first page),
+    # the result is paginated by cursor instead of page
     page = request.args.get("page", default="1")
     page_size = request.args.get("page_size", default="20")
-
-    # Build memoization key
-    # Create a list of non-None values and Concatenate the non-None values into a string
-    # we also use the users authorization token to distinguish between users
-    token = request.headers.get("Authorization")
-    non_none_values = [token]
-    memoize_key = "+".join(str(value) for value in non_none_values if value is not None)
-
-    # Because we use memoize, we need a key to retrieve the correct entries
-    response = get_all(memoize_key)
+    cursor = request.args.get("cursor", default=None)
 
     # Check that the pagination parameters are digits
     if not page.isdigit() or not page_size.isdigit():
@@ -155,15 +174,33 @@ def api_crud_task_get_all():
     page = int(page)
     page_size = int(page_size)
 
-    # Set paginated response
-    paginated_response = set_paginated_response(
-        response, page=page, page_size=page_size
-    )
+    # Cursor pagination: the database seeks to the first task after the cursor,
+    # ordered on (due_date, id). The cost of a page doesn't depend on its depth.
+    if cursor is not None:
+        try:
+            paginated_response = set_keyset_query_response(
+                Task.query, (Task.due_date, Task.id), cursor=cursor, page_size=page_size
+            )
+        except ValueError as error:
+            # Return a comprehensive 400 response
+            return response_bad_request(str(error))
+
+        paginated_response["result"] = [
+            task.serialize() for task in paginated_response["result"]
+        ]
+        return paginated_response
+
+    # Build memoization key. Tasks are not scoped per user, so all users share the cached pages
+    cache_key = build_cache_key("task_list", page=page, page_size=page_size)
 
-    # Build 200 response
-    response = make_response(paginated_response)
-    response.status_code = HTTPStatus.OK
-    return paginated_response
+    # Because we use memoize, we need a key to retrieve the correct entries
+    paginated_response = get_page(cache_key, page, page_size)
+
+    # Build 200 response. The memoized page holds the ids of its tasks, the response is
+    # assembled from their stored JSON encoding, the tasks are not encoded again
+    return json_fragments_response(
+        paginated_response, task_rows.get_encoded(paginated_response["result"])
+    )
 
 
 # @authorize.read
@@ -199,8 +236,13 @@ def api_crud_task_post():
     db.session.add(new_task)
     db.session.commit()
 
-    # The memoized response is no longer valid, flush the cache
-    memoize.clear_all_cache()
+    # Make the new task searchable
+    search_index.apply(new_task)
+
+    # Invalidate the memoized pages and the searches the new task would be part of. The row
+    # store doesn't hold the new task, discarding it tells the store the invalidation was ours
+    memoize.invalidate(affected_by(None, snapshot(new_task, CACHED_FIELDS)))
+    task_rows.discard(new_task.id)
     return response_ok(new_task)
 
 
@@ -224,6 +266,9 @@ def api_crud_task_patch(task_id):
     # Get PATCH data from request
     data = request.get_json()
 
+    # Remember the task as it was, to find the memoized responses it was part of
+    old_task = snapshot(task, CACHED_FIELDS)
+
     # Create a new task from data
     task = task.deserialize(data)
     try:
@@ -235,8 +280,13 @@ def api_crud_task_patch(task_id):
     db.session.add(task)
     db.session.commit()
 
-    # The memoized response is no longer valid, flush the cache
-    memoize.clear_all_cache()
+    # The task might have changed, replace it in the search index
+    search_index.apply(task)
+
+    # Invalidate the memoized pages and searches the task was, or now is, part of,
+    # and the serialized task they share
+    memoize.invalidate(affected_by(old_task, snapshot(task, CACHED_FIELDS)))
+    task_rows.discard(task.id)
 
     return response_ok(task)
 
@@ -252,15 +302,23 @@ def api_crud_task_delete(task_id):
     if not task:
         return response_not_found()
 
+    # Remember the task as it was, to find the memoized responses it was part of
+    old_task = snapshot(task, CACHED_FIELDS)
+
     # Delete the task from database
     db.session.delete(task)
     db.session.commit()
 
+    # A deleted task should no longer be found
+    search_index.discard(task_id)
+
     # Build 200 response
     response = make_response("DELETED")
     response.status_code = HTTPStatus.OK
 
-    # The memoized response is no longer valid, flush the cache
-    memoize.clear_all_cache()
+    # Invalidate the memoized pages and the searches the task was part of,
+    # and the serialized task they share
+    memoize.invalidate(affected_by(old_task, None))
+    task_rows.discard(task_id)
 
     return response
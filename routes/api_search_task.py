@@ -1,19 +1,48 @@
 """ search route for Task """
 from datetime import datetime
 from http import HTTPStatus
-from flask import request, make_response, jsonify
+from flask import request, make_response, jsonify, current_app
 from flasgger import swag_from
+from sqlalchemy.exc import OperationalError
 from routes import api
 from models import Task, TaskStatus
-from generic_helpers.levenshtein import search_by_levenshtein
+from database import db
+from generic_helpers.levenshtein import (
+    iter_search_by_levenshtein,
+    score_by_levenshtein,
+    THRESHOLD,
+)
+from generic_helpers.fts_search import search_by_fts
 from generic_helpers.is_valid_enum import is_valid_enum
-from generic_helpers.pagination import set_paginated_response
+from generic_helpers.pagination import (
+    set_paginated_response,
+    set_keyset_query_response,
+    set_keyset_sorted_response,
+    decode_cursor,
+    datetime_sort_value,
+)
 from generic_helpers.authenticator import authenticated
-from flask_application import memoize  # , authorize
+from generic_helpers.cache_key import build_cache_key
+from generic_helpers.cache_tags import tag_query
+from generic_helpers.json_fragments import json_fragments_response
+from flask_application import (
+    memoize,
+    search_index,
+    memoize_context,
+    task_rows,
+    MEMOIZE_STALE_TTL,
+)  # , authorize
 from apidocs.api_task_search import APITaskSearch
 
 apidocs = APITaskSearch()
 
+# Fields a title search might match, the full-text backend can search the description as well
+SEARCHED_FIELDS = ("title", "description")
+
+# Default and maximum amount of suggestions returned by /api/task/suggest
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 100
+
 
 def response_bad_request(error):
     """Dynamic 400 response"""
@@ -50,10 +79,107 @@ def set_and_check_date_filter_prerequisites(after, before):
     raise ValueError("either 'after' or 'before' is missing")
 
 
-@memoize
+def check_filter_parameters(status, after, before):
+    """Check the status and date filters, returns them as (lowercase status, after, before)
+
+    Raises a ValueError with the message for the end user when a filter is invalid
+    """
+
+    # check if the used status exist
+    if status and not is_valid_enum(status, TaskStatus):
+        # Dynamically build a list of statuses
+        valid_statuses = str([f"{status.value}" for status in TaskStatus])
+        raise ValueError(f"invalid statuses, use one of: {valid_statuses}")
+
+    # The status is validated case-insensitive, the TaskStatus values are lowercase
+    if status:
+        status = status.lower()
+
+    # check if the date stamps are correct (if any!), check_date_filter raises a
+    # ValueError if a check is failed
+    if after is not None or before is not None:
+        after, before = set_and_check_date_filter_prerequisites(after, before)
+
+    return status, after, before
+
+
+def search_by_full_text(query, filters=None):
+    """Search tasks on title with SQLite's full-text index, returns a tuple (matches, truncated)
+
+    matches is a list of (task, rank) tuples, the lower the rank the better the match. Only the
+    SEARCH_FTS_LIMIT best matches are returned, truncated is True when there were more.
+    Returns None if the 'fts5' search backend isn't configured, or when the full-text index is
+    not available, the 'levenshtein' backend is used instead. Optionally the description is
+    searched as well.
+    """
+
+    if current_app.config.get("SEARCH_BACKEND") != "fts5":
+        return None
+
+    field_names = ["title"]
+    if current_app.config.get("SEARCH_FTS_DESCRIPTION"):
+        field_names.append("description")
+
+    # Ask for one match more than the limit, to find out if the matches are truncated
+    limit = current_app.config.get("SEARCH_FTS_LIMIT")
+    try:
+        matches = search_by_fts(
+            query,
+            model=Task,
+            field_names=field_names,
+            limit=limit + 1 if limit is not None else None,
+            filters=filters,
+        )
+    except OperationalError:
+        # The full-text index doesn't exist (e.g. no FTS5 support), fall back to levenshtein
+        db.session.rollback()
+        return None
+    if limit is not None and len(matches) > limit:
+        return matches[:limit], True
+    return matches, False
+
+
+def build_search_filters(status=None, after=None, before=None):
+    """Build the filters, they are added to the WHERE clause so only matching tasks are fetched"""
+
+    filters = []
+
+    # Filter on status
+    if status:
+        filters.append(Task.status == TaskStatus(status))
+
+    # Filter on due_date, the due_date should be in between after and before
+    if after and before:
+        filters.extend([Task.due_date > after, Task.due_date < before])
+
+    return filters
+
+
+# pylint: disable=too-many-arguments,unused-argument
+def search_cache_tags(
+    result,
+    cache_key,
+    query=None,
+    status=None,
+    after=None,
+    before=None,
+    sort_order=None,
+):
+    """Tags of a memoized search result: its filters, a write only invalidates the
+    search results it can affect (see: cache_tags.py)
+    """
+    return tag_query(
+        equals={"status": TaskStatus(status)} if status else None,
+        ranges={"due_date": (after, before)} if after and before else None,
+        contains=(query, SEARCHED_FIELDS) if query else None,
+    )
+
+
+# Hot searches are refreshed in the background when they expire, instead of by a request
+@memoize(tags=search_cache_tags, stale_ttl=MEMOIZE_STALE_TTL, context=memoize_context)
 # pylint: disable=too-many-arguments
 def handle_search_request(
-    user_token,  # pylint: disable=unused-argument
+    cache_key,  # pylint: disable=unused-argument
     query=None,
     status=None,
     after=None,
@@ -62,41 +188,180 @@ def handle_search_request(
 ):
     """Memoized handler for search request
 
-    Method supports searching, filtering and sorting
+    Method supports searching, filtering and sorting. The tasks are sorted on due_date, ties
+    in order of best match. Returns a tuple (task ids, sort values, truncated): the ids of all
+    matching tasks in that order, the due_date sort value of every id (see: due_date_sort_value)
+    and whether the full-text backend left out matches (see: SEARCH_FTS_LIMIT). Every page is
+    sliced from this one memoized list, every cursor bisects the sort values.
+    The serialized tasks are looked up in the row store when the response is built (see:
+    RowStore), every cached search shares them.
     """
 
+    # Build the filters, they are added to the WHERE clause so only matching tasks are fetched
+    filters = build_search_filters(status=status, after=after, before=before)
+
+    # set sort_order
+    reverse_order = bool(sort_order == "descending")
+
     # Build a list of tasks
     if query is None:
-        # Return all tasks from the database. Serialize during the list comprehension.
-        tasks_list = [task.serialize() for task in Task.query.all()]
-    else:
-        # Search within the tasks from the database for a match based on the query
-        results = search_by_levenshtein(query, model=Task, field_name="title")
-        tasks_list = [task_tuple[0].serialize() for task_tuple in results]
-
-    # Filter results on status
-    if status:
-        # Build new tasks list were status matches the queried status
-        tasks_list = [x for x in tasks_list if x["status"] == status]
+        return search_all_tasks(filters, reverse_order) + (False,)
 
-    # Filter results on due_date
-    if after and before:
-        # Build new task were the tasks its due_date is in between after and before
-        tasks_list = [
-            x
-            for x in tasks_list
-            if after < datetime.fromisoformat(x["due_date"]) < before
-        ]
+    # Search with the full-text index or by scanning the table, otherwise search the search index
+    result = search_tasks(query, filters, reverse_order)
+    if result is not None:
+        return result
+    return search_task_index(query, status, after, before, reverse_order) + (False,)
 
-    # Sort the remaining task_list
-    def sort_by_due_date(item):
-        return datetime.fromisoformat(item["due_date"])
 
-    # set sort_order
-    reverse_order = bool(sort_order == "descending")
+def due_date_sort_value(due_date, reverse_order):
+    """Ascending sort value of a due_date, negated for the descending order"""
+    value = datetime_sort_value(due_date)
+    return -value if reverse_order else value
+
+
+def sorted_matches(matches):
+    """Sort (sort key, task id) tuples, the sort key starts with the due_date sort value
+
+    Returns a tuple (task ids, due_date sort values) in that order
+    """
+    matches = sorted(matches)
+    return [task_id for _, task_id in matches], [key[0] for key, _ in matches]
+
 
-    # return sorted result
-    return sorted(tasks_list, key=sort_by_due_date, reverse=reverse_order)
+def search_all_tasks(filters, reverse_order):
+    """Return the ids of all tasks passing the filters sorted on due_date (ties on id), and their
+    due_date sort values
+    """
+
+    # Let the database sort the tasks on due_date (ties in table order)
+    due_date_order = Task.due_date.desc() if reverse_order else Task.due_date.asc()
+    tasks = (
+        Task.query.with_entities(Task.id, Task.due_date)
+        .filter(*filters)
+        .order_by(due_date_order, Task.id)
+        .all()
+    )
+    return [task_id for task_id, _ in tasks], [
+        due_date_sort_value(due_date, reverse_order) for _, due_date in tasks
+    ]
+
+
+def search_tasks(query, filters, reverse_order):
+    """Search with the full-text index, or by scanning the table (the 'scan' strategy)
+
+    Returns a tuple (sorted task ids, due_date sort values, truncated), or None when neither is used
+    """
+    strategy = current_app.config.get("SEARCH_STRATEGY", "trigram")
+    matches, truncated = search_by_full_text(query, filters=filters) or (None, False)
+    if matches is None and strategy == "scan":
+        matches = iter_search_by_levenshtein(
+            query,
+            model=Task,
+            field_name="title",
+            threshold=current_app.config.get("SEARCH_THRESHOLD", THRESHOLD),
+            strategy="scan",
+            filters=filters,
+        )
+    if matches is None:
+        return None
+
+    # Sorted on due_date, ties in order of best match (score, then id)
+    return sorted_matches(
+        ((due_date_sort_value(task.due_date, reverse_order), score, task.id), task.id)
+        for task, score in matches
+    ) + (truncated,)
+
+
+def search_task_index(query, status, after, before, reverse_order):
+    """Search the (warm) search index, returns the sorted ids of the matching tasks and their
+    due_date sort values
+
+    The search index also holds the status and due_date of every task. So filtering and
+    sorting the matches happens in memory, the database isn't queried at all.
+    """
+    scored = score_by_levenshtein(
+        query,
+        model=Task,
+        field_name="title",
+        threshold=current_app.config.get("SEARCH_THRESHOLD", THRESHOLD),
+        strategy=current_app.config.get("SEARCH_STRATEGY", "trigram"),
+        workers=current_app.config.get("SEARCH_WORKERS", 1),
+    )
+    records = search_index.get_records(scored)
+
+    def record_matches(record):
+        if status and record["status"] != TaskStatus(status):
+            return False
+        return not (after and before) or after < record["due_date"] < before
+
+    # return sorted result, on due_date with ties in order of best match (score, then id)
+    return sorted_matches(
+        (
+            (due_date_sort_value(records[task_id]["due_date"], reverse_order), score, task_id),
+            task_id,
+        )
+        for task_id, score in scored.items()
+        if task_id in records and record_matches(records[task_id])
+    )
+
+
+# pylint: disable=too-many-arguments
+def handle_keyset_search_request(
+    cache_key,
+    cursor,
+    page_size,
+    query=None,
+    status=None,
+    after=None,
+    before=None,
+    sort_order=None,
+):
+    """Handler for a search request paginated by cursor, ordered on (due_date, id)
+
+    Without a title the database seeks to the first task after the cursor. With a title
+    the page is selected from the (memoized) search result by bisecting its due_dates, only
+    the tasks of the page are loaded.
+    """
+
+    descending = bool(sort_order == "descending")
+
+    if query is None:
+        # Let the database filter, seek and limit
+        tasks = Task.query.filter(
+            *build_search_filters(status=status, after=after, before=before)
+        )
+        response = set_keyset_query_response(
+            tasks,
+            (Task.due_date, Task.id),
+            cursor=cursor,
+            page_size=page_size,
+            descending=descending,
+        )
+        response["result"] = [task.serialize() for task in response["result"]]
+        return response
+
+    # Get the memoized search result, and select the page after the cursor
+    task_ids, sort_values, truncated = handle_search_request(
+        cache_key,
+        query=query,
+        status=status,
+        after=after,
+        before=before,
+        sort_order=sort_order,
+    )
+    response = set_keyset_sorted_response(
+        task_ids,
+        sort_values,
+        cursor=cursor,
+        page_size=page_size,
+        descending=descending,
+    )
+    if truncated:
+        response["truncated"] = True
+
+    # Assemble the response from the stored JSON encoding of the tasks of the page
+    return json_fragments_response(response, task_rows.get_encoded(response["result"]))
 
 
 @api.route("/api/task/search", methods=["GET"])
@@ -109,9 +374,11 @@ def api_search_task():
     # Get the value of the query parameter
     query = request.args.get("title", default=None)
 
-    # Get pagination parameters
+    # Get pagination parameters. When a cursor is given (empty for the first page),
+    # the result is paginated by cursor instead of page
     page = request.args.get("page", default="1")
     page_size = request.args.get("page_size", default="20")
+    cursor = request.args.get("cursor", default=None)
 
     # Some filtering query parameters. It's possible to filter on status and date (after AND before)
     # If Filtering on due_date request it's mandatory to provide both 'after' and 'before'
@@ -122,13 +389,6 @@ def api_search_task():
     # Sorting parameter, default is descending
     sort_order = request.args.get("sort_order", default="descending")
 
-    # Build memoization key
-    # Create a list of non-None values and Concatenate the non-None values into a string
-    # we also use the users authorization token to distinguish between users
-    token = request.headers.get("Authorization")
-    non_none_values = [token, query, status, after, before, sort_order]
-    memoize_key = "+".join(str(value) for value in non_none_values if value is not None)
-
     # Guard clauses
 
     # Check that the pagination parameters are digits
@@ -141,35 +401,65 @@ def api_search_task():
     page = int(page)
     page_size = int(page_size)
 
-    # check if the used status exist
-    if status and not is_valid_enum(status, TaskStatus):
-        # Dynamically build a list of statuses
-        valid_statuses = str([f"{status.value}" for status in TaskStatus])
+    # Check the status and the date filters, and convert them
+    try:
+        status, after, before = check_filter_parameters(status, after, before)
+    except ValueError as error:
+        # Return a comprehensive 400 response
+        return response_bad_request(error)
 
+    # Check if the sort_order is either ascending or descending
+    if sort_order not in ["ascending", "descending"]:
         # Return a comprehensive 400 response
-        return response_bad_request(f"invalid statuses, use one of: {valid_statuses}")
+        return response_bad_request(
+            "invalid sort value, use one of: ['ascending', 'descending']"
+        )
 
-    # check if the date stamps are correct (if any!)
-    if after is not None or before is not None:
+    # Check that the cursor is one of ours
+    if cursor is not None:
         try:
-            # check_date_filter raises a ValueError if a check is failed,
-            # in this manner the error message can be provided to the end user
-            after, before = set_and_check_date_filter_prerequisites(after, before)
+            decode_cursor(cursor, (datetime, int))
         except ValueError as error:
             # Return a comprehensive 400 response
             return response_bad_request(error)
 
-    # Check if the sort_order is either ascending or descending
-    if sort_order not in ["ascending", "descending"]:
-        # Return a comprehensive 400 response
-        return response_bad_request(
-            "invalid sort value, use one of: ['ascending', 'descending']"
+        # Return the page after the cursor. The whole search result is memoized, so
+        # the page and cursor modes share it
+        cache_key = build_cache_key(
+            "task_search",
+            title=query,
+            status=status,
+            after=after,
+            before=before,
+            sort_order=sort_order,
+        )
+        return handle_keyset_search_request(
+            cache_key,
+            cursor,
+            page_size,
+            query=query,
+            status=status,
+            after=after,
+            before=before,
+            sort_order=sort_order,
         )
 
     # Because we make use of a memoization decorator,
-    # we moved all code to a decorated handle_search_request method
-    tasks_list = handle_search_request(
-        memoize_key,
+    # we moved all code to a decorated handle_search_request method.
+    # The whole (ordered) search result is memoized, every page is sliced from it.
+    #
+    # Build memoization key from the (normalized) search parameters. Tasks are not
+    # scoped per user, so all users share the cached result of the same search.
+    cache_key = build_cache_key(
+        "task_search",
+        title=query,
+        status=status,
+        after=after,
+        before=before,
+        sort_order=sort_order,
+    )
+    task_ids, _, truncated = handle_search_request(
+        cache_key,
         query=query,
         status=status,
         after=after,
@@ -177,12 +467,52 @@ def api_search_task():
         sort_order=sort_order,
     )
 
-    # Set paginated response
+    # Set paginated response, holding the ids of the tasks of the page
     paginated_response = set_paginated_response(
-        tasks_list, page=page, page_size=page_size
+        task_ids, page=page, page_size=page_size
     )
 
+    # The full-text backend only returns the SEARCH_FTS_LIMIT best matches, say so when
+    # there were more: the last_page is the last page of those best matches
+    if truncated:
+        paginated_response["truncated"] = True
+
+    # Build 200 response, assembled from the stored JSON encoding of the tasks of the page
+    return json_fragments_response(
+        paginated_response, task_rows.get_encoded(paginated_response["result"])
+    )
+
+
+@api.route("/api/task/suggest", methods=["GET"])
+@swag_from(apidocs.api_suggest_task)
+@authenticated
+# @authorize.read
+def api_suggest_task():
+    """Suggest task titles starting with a prefix (autocomplete)"""
+
+    # Get the prefix and the maximum amount of suggestions
+    prefix = request.args.get("prefix", default=None)
+    limit = request.args.get("limit", default=str(SUGGEST_LIMIT))
+
+    # Guard clauses
+
+    # A prefix is mandatory, an empty prefix would suggest every title
+    if not prefix:
+        # Return a comprehensive 400 response
+        return response_bad_request("Missing prefix. Please provide a prefix.")
+
+    # Check that the limit is a digit, and not more than the maximum
+    if not limit.isdigit() or not 0 < int(limit) <= MAX_SUGGEST_LIMIT:
+        # Return a comprehensive 400 response
+        return response_bad_request(
+            f"Invalid limit. Please provide a numeric value from 1 to {MAX_SUGGEST_LIMIT}."
+        )
+
+    # The prefix index is kept up to date by the writers, a lookup is a binary search
+    # followed by reading the next 'limit' titles. That's cheap enough to skip memoization.
+    suggestions = search_index.get_index("prefix").complete(prefix, limit=int(limit))
+
     # Build 200 response
-    response = make_response(paginated_response)
+    response = make_response(jsonify({"result": suggestions}))
     response.status_code = HTTPStatus.OK
-    return paginated_response
+    return response
@@ -0,0 +1,191 @@
+""" Unit test for /api/task """
+import unittest
+from datetime import datetime, timedelta
+from flask import Flask
+from flask_bcrypt import Bcrypt
+from routes import api
+from models.users_model import User
+from models.task_model import Task, TaskStatus
+from database import db
+from generic_helpers.authenticator import Authenticator
+from generic_helpers.search_index import reset_search_indexes
+from flask_application import memoize, task_rows
+
+
+class TaskTestCase(unittest.TestCase):
+    """Tests for /api/task"""
+
+    def setUp(self):
+        """Setup the test environment"""
+
+        # Create a test Flask application
+        self.app = Flask(__name__)
+        self.app.register_blueprint(api)
+
+        # Use an in-memory SQLite database for testing
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+        # Set Secret key (needed for creating hashes)
+        self.app.config["SECRET_KEY"] = "unittest"
+
+        # Set up the Flask test client
+        self.client = self.app.test_client()
+
+        # Every test has its own database, don't serve results of a former test
+        reset_search_indexes()
+        memoize.clear_all_cache()
+        task_rows.clear()
+
+        # Initialize the test database and create a test user
+        db.init_app(self.app)
+        with self.app.app_context():
+            # Create table(s)
+            db.create_all()
+
+            # Encrypt a password using bcrypt
+            bcrypt = Bcrypt()
+            password_hash = bcrypt.generate_password_hash("test_password").decode(
+                "utf-8"
+            )
+
+            # Create the user object with the hashed password
+            self.test_user = User(email="test@example.com", password=password_hash)
+
+            # Commit the user to the database
+            db.session.add(self.test_user)
+            db.session.commit()
+
+            # Create authentication token
+            authenticator = Authenticator(
+                user_obj=self.test_user, password="test_password"
+            )
+            self.token = authenticator.generate_token()
+
+            # Create five tasks in the database, the due_date is in reverse order of the id
+            db.session.add_all(
+                [
+                    Task(
+                        title=f"Task {i}",
+                        description=f"Description {i}",
+                        status=TaskStatus.PENDING,
+                        due_date=datetime(2023, 1, 10) - timedelta(days=i),
+                    )
+                    for i in range(1, 6)
+                ]
+            )
+            db.session.commit()
+
+    def tearDown(self):
+        """Clean up any test data or resources"""
+
+        # Clean up the test database
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def get_tasks(self, **query_string):
+        """GET /api/task with the test user its token"""
+        return self.client.get(
+            "/api/task",
+            headers={"Authorization": self.token},
+            query_string=query_string,
+        )
+
+    def test_get_tasks_paginated(self):
+        """Test that the tasks are paginated in order of id"""
+
+        # Request the second page
+        response = self.get_tasks(page=2, page_size=2)
+
+        # Assert the response status code and response_data
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["current_page"], 2)
+        self.assertEqual(response.json["last_page"], 3)
+        self.assertEqual([task["id"] for task in response.json["result"]], [3, 4])
+
+    def test_get_tasks_out_of_bounds(self):
+        """Test that a page out of bounds returns an empty result"""
+
+        # Request a page after the last page
+        response = self.get_tasks(page=4, page_size=2)
+
+        # Assert the response status code and response_data
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(
+            response.json, {"current_page": 4, "last_page": 3, "result": []}
+        )
+
+    def test_get_tasks_invalid_page(self):
+        """Test that a non-numeric page is a bad request"""
+
+        # Request an invalid page
+        response = self.get_tasks(page="first")
+
+        # Assert the response status code
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_task_flushes_pages(self):
+        """Test that a new task is visible on the cached pages"""
+
+        # Fill the cache with the last page
+        self.assertEqual(len(self.get_tasks(page=3, page_size=2).json["result"]), 1)
+
+        # Create a new task
+        response = self.client.post(
+            "/api/task",
+            headers={"Authorization": self.token},
+            json={"title": "Task 6", "due_date": "2023-01-01T12:00:00"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Assert the new task is on the last page
+        response = self.get_tasks(page=3, page_size=2)
+        self.assertEqual([task["id"] for task in response.json["result"]], [5, 6])
+
+    def test_get_tasks_by_cursor(self):
+        """Test walking all tasks by cursor, ordered on due_date"""
+
+        # Walk all pages, starting with an empty cursor
+        ids = []
+        cursor = ""
+        while cursor is not None:
+            response = self.get_tasks(cursor=cursor, page_size=2)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json["result"]), 2)
+            ids.extend(task["id"] for task in response.json["result"])
+            cursor = response.json["next_cursor"]
+
+        # Assert all tasks are returned once, in order of due_date
+        self.assertEqual(ids, [5, 4, 3, 2, 1])
+
+    def test_get_tasks_invalid_cursor(self):
+        """Test that a cursor which can't be decoded is a bad request"""
+
+        # Request an invalid cursor
+        response = self.get_tasks(cursor="not-a-cursor")
+
+        # Assert the response status code
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_stats(self):
+        """Test that the admin endpoint reports the hits and misses of the memoized pages"""
+
+        memoize.reset_stats()
+        self.get_tasks(page=1, page_size=2)
+        self.get_tasks(page=1, page_size=2)
+
+        response = self.client.get(
+            "/api/admin/cache", headers={"Authorization": self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["hits"], 1)
+        self.assertEqual(response.json["misses"], 1)
+        self.assertEqual(response.json["hit_ratio"], 0.5)
+        self.assertEqual(response.json["usage"]["items"], 1)
+        (counters,) = [
+            counters
+            for name, counters in response.json["functions"].items()
+            if name.endswith("get_page")
+        ]
+        self.assertEqual((counters["hits"], counters["misses"]), (1, 1))
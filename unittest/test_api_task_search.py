@@ -1,5 +1,8 @@
 """ Unit test for /api/task/search """
+import base64
+import time
 import unittest
+from unittest import mock
 from datetime import datetime
 from flask import Flask
 from flask_bcrypt import Bcrypt
@@ -8,6 +11,9 @@ from models.users_model import User
 from models.task_model import Task, TaskStatus
 from database import db
 from generic_helpers.authenticator import Authenticator
+from generic_helpers.search_index import reset_search_indexes
+from generic_helpers.fts_search import create_fts_index, search_by_fts
+from flask_application import memoize, task_rows
 
 
 class AuthTestCase(unittest.TestCase):
@@ -30,6 +36,10 @@ class AuthTestCase(unittest.TestCase):
         # Set up the Flask test client
         self.client = self.app.test_client()
 
+        # Every test has its own database, the search index should be rebuilt from it
+        reset_search_indexes()
+        task_rows.clear()
+
         # Initialize the test database and create a test user
         db.init_app(self.app)
         with self.app.app_context():
@@ -262,3 +272,362 @@ class AuthTestCase(unittest.TestCase):
         # Assert the response status code and response_data
         self.assertEqual(response.status_code, 200)
         self.assertDictEqual(response.json, expected_result)
+
+    def test_search_title_status_date_range(self):
+        """Test searching on title, status (case-insensitive) and date range at once"""
+
+        # Send a request to search tasks
+        response = self.client.get(
+            "/api/task/search",
+            headers={"Authorization": self.token},
+            query_string={
+                "title": "task",
+                "status": "STARTED",
+                "after": "2022-12-31",
+                "before": "2023-01-03",
+            },
+        )
+
+        # Assert only the started task within the date range is returned
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task["id"] for task in response.json["result"]], [2])
+
+    def test_search_by_cursor(self):
+        """Test walking the search results by cursor, with and without title"""
+
+        for title in [None, "task"]:
+            # Walk all pages, starting with an empty cursor
+            ids = []
+            cursor = ""
+            while cursor is not None:
+                query_string = {"cursor": cursor, "page_size": 2}
+                if title:
+                    query_string["title"] = title
+                response = self.client.get(
+                    "/api/task/search",
+                    headers={"Authorization": self.token},
+                    query_string=query_string,
+                )
+                self.assertEqual(response.status_code, 200)
+                ids.extend(task["id"] for task in response.json["result"])
+                cursor = response.json["next_cursor"]
+
+            # Assert all tasks are returned once, in (default) descending order of due_date
+            self.assertEqual(ids, [3, 2, 1])
+
+    def test_search_threshold(self):
+        """Test that SEARCH_THRESHOLD is the distance a matching title stays below"""
+
+        for threshold, expected in [(2, []), (3, [3, 2, 1])]:
+            self.app.config["SEARCH_THRESHOLD"] = threshold
+            memoize.clear_all_cache()
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string={"title": "task"},
+            )
+            self.assertEqual([task["id"] for task in response.json["result"]], expected)
+
+    def test_search_by_cursor_loads_page_only(self):
+        """Test that a page by cursor of a title search only loads the tasks of that page"""
+
+        loads = task_rows.usage()["loads"]
+        response = self.client.get(
+            "/api/task/search",
+            headers={"Authorization": self.token},
+            query_string={"title": "task", "cursor": "", "page_size": 1},
+        )
+        self.assertEqual([task["id"] for task in response.json["result"]], [3])
+        self.assertEqual(task_rows.usage()["loads"] - loads, 1)
+
+    def test_cursor_with_timezone_rejected(self):
+        """Test that a cursor holding a datetime with a timezone is a bad request"""
+
+        cursor = base64.urlsafe_b64encode(b'["2023-01-02T00:00:00+02:00", 3]').decode("ascii")
+        for title in [None, "task"]:
+            query_string = {"cursor": cursor}
+            if title:
+                query_string["title"] = title
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string=query_string,
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_cursor_ties_ordered_like_pages(self):
+        """Test that tasks with the same due_date are in the same order by cursor and by page"""
+
+        with self.app.app_context():
+            for _ in range(3):
+                db.session.add(Task(title="Tie", due_date=datetime(2023, 1, 2)))
+            db.session.commit()
+
+        for sort_order in ["descending", "ascending"]:
+            query_string = {"sort_order": sort_order, "page_size": 10}
+            by_page = self.client.get(
+                "/api/task/search", headers={"Authorization": self.token}, query_string=query_string
+            )
+            by_cursor = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string=dict(query_string, cursor=""),
+            )
+            self.assertEqual(
+                [task["id"] for task in by_cursor.json["result"]],
+                [task["id"] for task in by_page.json["result"]],
+            )
+
+    def test_search_after_writes(self):
+        """Test that the search sees created, updated and deleted tasks"""
+
+        def search(title):
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string={"title": title, "status": "pending"},
+            )
+            return [task["id"] for task in response.json["result"]]
+
+        # Warm up the search index
+        self.assertEqual(search("groceries"), [])
+
+        # Create a task, and find it
+        response = self.client.post(
+            "/api/task",
+            headers={"Authorization": self.token},
+            json={"title": "Groceries", "status": "pending", "due_date": "2023-01-04T12:00:00"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(search("groceries"), [4])
+
+        # Update its status, it no longer matches the status filter
+        response = self.client.patch(
+            "/api/task/4",
+            headers={"Authorization": self.token},
+            json={"status": "started"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(search("groceries"), [])
+
+        # Delete a task, and don't find it anymore
+        response = self.client.delete("/api/task/1", headers={"Authorization": self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(search("task 1"), [])
+
+    def test_search_cache_key_normalized(self):
+        """Test that searches differing only in case share one cache entry"""
+
+        memoize.clear_all_cache()
+        for title in ["Task", "TASK", "task"]:
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string={"title": title},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["result"]), 3)
+        self.assertEqual(memoize.usage()["items"], 1)
+
+    def test_pages_share_search(self):
+        """Test that all pages (and the cursor) of a search are sliced from one cache entry"""
+
+        memoize.clear_all_cache()
+        memoize.reset_stats()
+        pages = []
+        for query_string in [{"page": 1}, {"page": 2}, {"page": 3}, {"cursor": ""}]:
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string=dict(query_string, title="task", page_size=1),
+            )
+            self.assertEqual(response.status_code, 200)
+            pages.append([task["id"] for task in response.json["result"]])
+        self.assertEqual(sorted(sum(pages[:3], [])), [1, 2, 3])
+        self.assertEqual(pages[3], pages[0])
+        self.assertEqual(memoize.usage()["items"], 1)
+        self.assertEqual(memoize.stats()["functions"]["routes.api_search_task.handle_search_request"]["misses"], 1)
+
+    def test_write_invalidates_affected_searches(self):
+        """Test that a write only invalidates the memoized searches it can affect"""
+
+        def search(**query_string):
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string=query_string,
+            )
+            return [task["id"] for task in response.json["result"]]
+
+        memoize.clear_all_cache()
+        self.assertEqual(search(status="completed"), [3])
+        self.assertEqual(search(title="task 1"), [1])
+        self.assertEqual(search(title="groceries"), [])
+        self.assertEqual(memoize.usage()["items"], 3)
+
+        # Rename the pending 'Task 1', the search for completed tasks is not affected
+        response = self.client.patch(
+            "/api/task/1",
+            headers={"Authorization": self.token},
+            json={"title": "Groceries"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(memoize.usage()["items"], 1)
+        self.assertEqual(search(title="task 1"), [])
+        self.assertEqual(search(title="groceries"), [1])
+
+    def test_search_refreshed_in_background(self):
+        """Test that an expired search is served stale and refreshed within an app context"""
+
+        def search():
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string={"title": "task"},
+            )
+            return [task["id"] for task in response.json["result"]]
+
+        memoize.clear_all_cache()
+        memoize.reset_stats()
+        self.assertEqual(search(), [3, 2, 1])
+
+        # After the ttl, the stale result is served and refreshed in the background
+        expired = datetime.now().timestamp() + memoize.ttl + 1
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=expired):
+            self.assertEqual(search(), [3, 2, 1])
+
+            # Wait for the background refresh
+            deadline = time.monotonic() + 10
+            while memoize.stats()["computations"] < 2 or memoize.in_flight:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+
+            # The refreshed result is fresh again
+            self.assertEqual(search(), [3, 2, 1])
+        stats = memoize.stats()
+        self.assertEqual((stats["stale_hits"], stats["refreshes"], stats["hits"]), (1, 1, 1))
+
+    def test_suggest(self):
+        """Test the autocompletion of titles, it's kept in sync with the writes"""
+
+        def suggest(prefix, limit=None):
+            query_string = {"prefix": prefix}
+            if limit is not None:
+                query_string["limit"] = limit
+            return self.client.get(
+                "/api/task/suggest",
+                headers={"Authorization": self.token},
+                query_string=query_string,
+            )
+
+        response = suggest("TASK")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"result": ["Task 1", "Task 2", "Task 3"]})
+        self.assertEqual(suggest("task", limit=2).json["result"], ["Task 1", "Task 2"])
+
+        # Rename a task, and suggest the new title
+        response = self.client.patch(
+            "/api/task/1",
+            headers={"Authorization": self.token},
+            json={"title": "Groceries"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(suggest("gro").json["result"], ["Groceries"])
+        self.assertEqual(suggest("task").json["result"], ["Task 2", "Task 3"])
+
+    def test_suggest_invalid(self):
+        """Test that a missing prefix or an invalid limit is a bad request"""
+
+        for query_string in [{}, {"prefix": "task", "limit": "0"}, {"prefix": "task", "limit": "x"}]:
+            response = self.client.get(
+                "/api/task/suggest",
+                headers={"Authorization": self.token},
+                query_string=query_string,
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class BKTreeAuthTestCase(AuthTestCase):
+    """Tests for /api/task/search using the BK-tree levenshtein strategy"""
+
+    def setUp(self):
+        """Setup the test environment with the BK-tree strategy"""
+        super().setUp()
+        self.app.config["SEARCH_STRATEGY"] = "bktree"
+
+        # Make sure the results are not served from a trigram test its cache
+        memoize.clear_all_cache()
+
+
+class BatchAuthTestCase(AuthTestCase):
+    """Tests for /api/task/search using the batch levenshtein strategy"""
+
+    def setUp(self):
+        """Setup the test environment with the batch strategy"""
+        super().setUp()
+        self.app.config["SEARCH_STRATEGY"] = "batch"
+
+        # Make sure the results are not served from a trigram test its cache
+        memoize.clear_all_cache()
+
+
+class FTSAuthTestCase(AuthTestCase):
+    """Tests for /api/task/search using the SQLite FTS5 search backend"""
+
+    def setUp(self):
+        """Setup the test environment with a full-text index"""
+        super().setUp()
+
+        # Use the full-text search backend and build the index for the existing tasks
+        self.app.config["SEARCH_BACKEND"] = "fts5"
+        with self.app.app_context():
+            self.assertTrue(create_fts_index(Task, ["title", "description"]))
+
+        # Make sure the results are not served from a levenshtein test its cache
+        memoize.clear_all_cache()
+
+    def test_search_threshold(self):
+        """The full-text backend ranks its matches, it has no levenshtein threshold"""
+
+    def test_fts_index_in_sync(self):
+        """Test that the triggers keep the full-text index in sync with the tasks table"""
+
+        with self.app.app_context():
+            # Update and delete a task, and add a new one
+            task = db.session.get(Task, 1)
+            task.title = "Groceries"
+            db.session.delete(db.session.get(Task, 2))
+            db.session.add(Task(title="More groceries", description="Milk"))
+            db.session.commit()
+
+            # Assert the index reflects the changes
+            results = search_by_fts("groceries", model=Task, field_names=["title"])
+            self.assertCountEqual([task.title for task, _ in results], ["Groceries", "More groceries"])
+            self.assertEqual(search_by_fts("k 2", model=Task, field_names=["title"]), [])
+
+            # The description is only searched when asked for
+            self.assertEqual(search_by_fts("milk", model=Task, field_names=["title"]), [])
+            results = search_by_fts("milk", model=Task, field_names=["title", "description"])
+            self.assertEqual([task.title for task, _ in results], ["More groceries"])
+
+    def test_fts_limit(self):
+        """Test that the amount of results is limited by SQLite"""
+
+        with self.app.app_context():
+            results = search_by_fts("task", model=Task, field_names=["title"], limit=2)
+            self.assertEqual(len(results), 2)
+
+    def test_fts_limit_reported(self):
+        """Test that a search cut by SEARCH_FTS_LIMIT paginates the best matches, and says so"""
+
+        for limit, truncated in [(2, True), (3, None)]:
+            self.app.config["SEARCH_FTS_LIMIT"] = limit
+            memoize.clear_all_cache()
+            response = self.client.get(
+                "/api/task/search",
+                headers={"Authorization": self.token},
+                query_string={"title": "task", "page_size": 1},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["last_page"], min(limit, 3))
+            self.assertEqual(response.json.get("truncated"), truncated)
@@ -0,0 +1,74 @@
+""" Unit tests for decoding authentication tokens """
+import unittest
+from unittest import mock
+from flask import Flask
+from flask_bcrypt import Bcrypt
+from models.users_model import User
+from database import db
+from generic_helpers.authenticator import (
+    Authenticator,
+    clear_verified_tokens,
+    decode_token,
+    get_serializer,
+)
+
+
+class AuthenticatorTestCase(unittest.TestCase):
+    """Tests for decode_token"""
+
+    def setUp(self):
+        """Setup a test application with a user and a token"""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.app.config["SECRET_KEY"] = "unittest"
+        clear_verified_tokens()
+
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            password_hash = Bcrypt().generate_password_hash("test_password").decode("utf-8")
+            user = User(email="test@example.com", password=password_hash)
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+            self.token = Authenticator(user_obj=user, password="test_password").generate_token()
+
+    def tearDown(self):
+        """Clean up the test database"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def count_loads(self):
+        """Patch the serializer to count how often a token is decoded"""
+        serializer = get_serializer(self.app.config["SECRET_KEY"])
+        return mock.patch.object(serializer, "loads", wraps=serializer.loads)
+
+    def test_decoded_once(self):
+        """Test that a token is decoded once per request, and not again by the next requests"""
+        with self.count_loads() as loads:
+            with self.app.test_request_context():
+                self.assertEqual(decode_token(self.token), (True, self.user_id))
+                self.assertTrue(Authenticator.verify_token(self.token))
+                self.assertEqual(Authenticator.get_user_from_token(self.token).id, self.user_id)
+            with self.app.test_request_context():
+                self.assertTrue(Authenticator.verify_token(self.token))
+        self.assertEqual(loads.call_count, 1)
+
+    def test_invalid_token(self):
+        """Test that an invalid token is not remembered"""
+        with self.count_loads() as loads:
+            for _ in range(2):
+                with self.app.test_request_context():
+                    self.assertEqual(decode_token("invalid"), (False, None))
+                    self.assertIsNone(Authenticator.get_user_from_token("invalid"))
+        self.assertEqual(loads.call_count, 2)
+
+    def test_secret_key_changed(self):
+        """Test that a token verified with a former secret key isn't valid anymore"""
+        with self.app.test_request_context():
+            self.assertTrue(Authenticator.verify_token(self.token))
+        self.app.config["SECRET_KEY"] = "rotated"
+        with self.app.test_request_context():
+            self.assertFalse(Authenticator.verify_token(self.token))
@@ -0,0 +1,60 @@
+""" Unit tests for the BK-tree """
+import unittest
+from Levenshtein import distance
+from generic_helpers.bk_tree import BKTree
+
+
+class BKTreeTestCase(unittest.TestCase):
+    """Tests for BKTree"""
+
+    def setUp(self):
+        """Setup a tree with a few titles"""
+        self.titles = {
+            1: "Task 1",
+            2: "Task 2",
+            3: "Groceries",
+            4: "Grocery list",
+            5: "Tax return",
+            6: "Task 1",
+        }
+        self.tree = BKTree()
+        for key, title in self.titles.items():
+            self.tree.add(key, title)
+
+    def brute_force(self, query, max_distance):
+        """Search by comparing every title"""
+        return sorted(
+            (key, title.lower(), distance(query, title.lower()))
+            for key, title in self.titles.items()
+            if distance(query, title.lower()) <= max_distance
+        )
+
+    def test_search_equals_brute_force(self):
+        """Test that pruning the tree doesn't lose any match"""
+        for query in ["task 1", "grocer", "tax", "something else"]:
+            for max_distance in range(0, 12):
+                self.assertEqual(
+                    sorted(self.tree.search(query, max_distance)),
+                    self.brute_force(query, max_distance),
+                )
+
+    def test_replace_and_remove(self):
+        """Test that replaced and removed values are no longer found"""
+        self.tree.add(1, "Shopping")
+        self.tree.remove(6)
+        self.titles[1] = "Shopping"
+        del self.titles[6]
+        self.assertEqual(self.tree.search("task 1", 0), [])
+        self.assertEqual(self.tree.search("shopping", 0), [(1, "shopping", 0)])
+        self.assertEqual(
+            sorted(self.tree.search("task", 5)), self.brute_force("task", 5)
+        )
+
+    def test_empty_nodes_rebuilt(self):
+        """Test that renames don't grow the tree without bound"""
+        for generation in range(100):
+            for key in self.titles:
+                self.tree.add(key, f"Title {key} {generation}")
+        self.assertLessEqual(self.tree.empty_nodes, self.tree.nodes * 0.5)
+        self.assertLessEqual(self.tree.nodes, 2 * len(self.titles))
+        self.assertEqual(self.tree.search("title 1 99", 0), [(1, "title 1 99", 0)])
@@ -0,0 +1,30 @@
+""" Unit tests for the memoization key builder """
+import unittest
+from datetime import datetime
+from generic_helpers.cache_key import build_cache_key
+
+
+class CacheKeyTestCase(unittest.TestCase):
+    """Tests for build_cache_key"""
+
+    def test_normalized(self):
+        """Test that the key doesn't depend on case, parameter order or None parameters"""
+        self.assertEqual(
+            build_cache_key("task_search", title="Task 1", status="PENDING", before=None),
+            build_cache_key("task_search", status="pending", title="task 1"),
+        )
+        self.assertEqual(
+            build_cache_key("task_search", after=datetime(2023, 1, 1)),
+            "task_search:public:after=2023-01-01T00%3A00%3A00",
+        )
+
+    def test_distinct(self):
+        """Test that namespaces, scopes and values don't collide"""
+        keys = {
+            build_cache_key("task_search", title="task"),
+            build_cache_key("task_list", title="task"),
+            build_cache_key("task_search", scope="user:1", title="task"),
+            build_cache_key("task_search", title="task&status=pending"),
+            build_cache_key("task_search", title="task", status="pending"),
+        }
+        self.assertEqual(len(keys), 5)
@@ -0,0 +1,36 @@
+""" Unit tests for the tags of memoized results """
+import unittest
+from datetime import datetime
+from generic_helpers.cache_tags import tag_query, tag_ids, affected_by
+
+
+class CacheTagsTestCase(unittest.TestCase):
+    """Tests for affected_by"""
+
+    def setUp(self):
+        """Setup a row before and after an update"""
+        self.old_row = {"id": 1, "title": "Task 1", "status": "pending", "due_date": datetime(2023, 1, 1)}
+        self.new_row = dict(self.old_row, status="started")
+
+    def test_query(self):
+        """Test that a query result is affected when the old or the new row passes its filters"""
+        affected = affected_by(self.old_row, self.new_row)
+        self.assertTrue(affected(tag_query(equals={"status": "pending"})))
+        self.assertTrue(affected(tag_query(equals={"status": "started"})))
+        self.assertFalse(affected(tag_query(equals={"status": "completed"})))
+        self.assertTrue(affected(tag_query()))
+
+    def test_range_and_text(self):
+        """Test the range (exclusive bounds) and the case-insensitive text filters"""
+        affected = affected_by(None, self.new_row)
+        self.assertTrue(affected(tag_query(ranges={"due_date": (datetime(2022, 12, 31), datetime(2023, 1, 2))})))
+        self.assertFalse(affected(tag_query(ranges={"due_date": (datetime(2023, 1, 1), datetime(2023, 1, 2))})))
+        self.assertTrue(affected(tag_query(contains=("TASK", ("title",)))))
+        self.assertFalse(affected(tag_query(contains=("groceries", ("title", "description")))))
+
+    def test_ids(self):
+        """Test that a page is affected by a change of one of its rows, or any created or deleted row"""
+        self.assertTrue(affected_by(self.old_row, self.new_row)(tag_ids([1, 2])))
+        self.assertFalse(affected_by(self.old_row, self.new_row)(tag_ids([2, 3])))
+        self.assertTrue(affected_by(None, self.new_row)(tag_ids([2, 3])))
+        self.assertTrue(affected_by(self.old_row, None)(tag_ids([])))
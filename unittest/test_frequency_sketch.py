@@ -0,0 +1,34 @@
+""" Unit tests for the frequency sketch """
+import unittest
+from generic_helpers.frequency_sketch import FrequencySketch, MAX_COUNT
+
+
+class FrequencySketchTestCase(unittest.TestCase):
+    """Tests for FrequencySketch"""
+
+    def setUp(self):
+        """Setup a sketch"""
+        self.sketch = FrequencySketch(width=1000)
+
+    def test_width(self):
+        """Test that the width is rounded up to a power of two"""
+        self.assertEqual(self.sketch.width, 1024)
+
+    def test_estimate(self):
+        """Test that the estimate counts the accesses (it never underestimates)"""
+        for _ in range(3):
+            self.sketch.increment("task")
+        self.sketch.increment("groceries")
+        self.assertGreaterEqual(self.sketch.estimate("task"), 3)
+        self.assertGreaterEqual(self.sketch.estimate("groceries"), 1)
+        self.assertGreater(self.sketch.estimate("task"), self.sketch.estimate("groceries"))
+
+    def test_saturation_and_aging(self):
+        """Test that counters saturate, and are halved every sample_size increments"""
+        sketch = FrequencySketch(width=64, sample_size=40)
+        for _ in range(20):
+            sketch.increment("task")
+        self.assertEqual(sketch.estimate("task"), MAX_COUNT)
+        for _ in range(20):
+            sketch.increment("groceries")
+        self.assertEqual(sketch.estimate("task"), MAX_COUNT // 2)
@@ -0,0 +1,46 @@
+""" Unit tests for assembling JSON responses from pre-encoded fragments """
+import unittest
+from flask import Flask, jsonify
+from generic_helpers.json_fragments import (
+    encode_json,
+    assemble_json,
+    json_fragments_response,
+)
+
+
+class JSONFragmentsTestCase(unittest.TestCase):
+    """Tests for json_fragments"""
+
+    def setUp(self):
+        """Setup a page of tasks, one with a non-ASCII title"""
+        self.app = Flask(__name__)
+        self.tasks = [
+            {"id": 1, "title": "Task 1", "status": "pending", "due_date": "2024-01-01T00:00:00"},
+            {"id": 2, "title": "Tâche 2", "status": "started", "due_date": "2024-01-02T00:00:00"},
+        ]
+
+    def test_assemble_like_jsonify(self):
+        """Test that an assembled page is byte for byte the same as jsonify of the page"""
+        for envelope in (
+            {"current_page": 1, "last_page": 3},
+            {"next_cursor": None},
+            {"next_cursor": "WyIyMDI0Il0="},
+        ):
+            with self.app.app_context():
+                expected = jsonify(dict(envelope, result=self.tasks)).get_data()
+            fragments = [encode_json(task) for task in self.tasks]
+            self.assertEqual(assemble_json(envelope, fragments), expected)
+
+    def test_empty_page(self):
+        """Test that a page without fragments holds an empty result, the value in the envelope is replaced"""
+        self.assertEqual(
+            assemble_json({"result": [1, 2], "current_page": 2, "last_page": 1}, []),
+            b'{"current_page":2,"last_page":1,"result":[]}\n',
+        )
+
+    def test_response(self):
+        """Test that the response is JSON"""
+        with self.app.app_context():
+            response = json_fragments_response({"next_cursor": None}, [encode_json(self.tasks[0])])
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_json(), {"next_cursor": None, "result": [self.tasks[0]]})
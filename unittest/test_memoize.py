@@ -0,0 +1,427 @@
+""" Unit tests for the memoize decorator """
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from generic_helpers.memoize import Memoize
+from generic_helpers.memoize_backends import (
+    MemoryBackend,
+    SQLiteBackend,
+    TieredBackend,
+    approximate_size,
+)
+from generic_helpers.frequency_sketch import FrequencySketch
+from generic_helpers.memoize_codecs import Compressed, ZlibCodec
+
+
+def wait_for_computations(memoize, computations, timeout=10):
+    """Wait until memoize computed (and stored) the amount of results, e.g. by a background refresh"""
+    deadline = time.monotonic() + timeout
+    while memoize.stats()["computations"] < computations or memoize.in_flight:
+        if time.monotonic() > deadline:
+            raise TimeoutError("No background refresh")
+        time.sleep(0.01)
+
+
+class MemoizeTestCase(unittest.TestCase):
+    """Tests for Memoize"""
+
+    def create_memoize(self):
+        """Create the Memoize instance under test"""
+        return Memoize(ttl=10, max_items=2)
+
+    def setUp(self):
+        """Setup a memoized function which counts its calls"""
+        self.memoize = self.create_memoize()
+        self.calls = []
+
+        @self.memoize
+        def square(value):
+            self.calls.append(value)
+            return value * value
+
+        self.square = square
+
+    def test_hit(self):
+        """Test that a cached result is returned without calling the function"""
+        self.assertEqual(self.square(3), 9)
+        self.assertEqual(self.square(3), 9)
+        self.assertEqual(self.calls, [3])
+
+    def test_expiry(self):
+        """Test that an item is cached for ttl seconds"""
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=1000):
+            self.square(3)
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=1010):
+            self.square(3)
+        self.assertEqual(self.calls, [3])
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=1011):
+            self.square(3)
+        self.assertEqual(self.calls, [3, 3])
+
+    def test_least_recently_used_is_purged(self):
+        """Test that the least recently used item is purged when max_items is exceeded"""
+        self.square(1)
+        self.square(2)
+        self.square(1)
+        self.square(3)
+        self.assertEqual(self.memoize.backend.keys(), [1, 3])
+
+    def test_clear(self):
+        """Test that cleared items are computed again"""
+        self.square(1)
+        self.square(2)
+        self.memoize.clear_cache_by_key(1)
+        self.square(1)
+        self.memoize.clear_all_cache()
+        self.square(2)
+        self.assertEqual(self.calls, [1, 2, 1, 2])
+
+    def test_single_flight(self):
+        """Test that concurrent misses on the same key execute the function once"""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        @self.memoize
+        def slow(value):
+            calls.append(value)
+            started.set()
+            release.wait(5)
+            return value * 2
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(slow, 21)]
+            started.wait(5)
+            futures.extend(executor.submit(slow, 21) for _ in range(3))
+
+            # Give the followers time to start waiting, then let the leader finish
+            time.sleep(0.1)
+            release.set()
+            self.assertEqual([future.result() for future in futures], [42] * 4)
+        self.assertEqual(calls, [21])
+
+    def test_backend_called_outside_lock(self):
+        """Test that a slow backend lookup (e.g. disk I/O) doesn't block the lookups of other keys"""
+        started = threading.Event()
+        release = threading.Event()
+        get = self.memoize.backend.get
+
+        def slow_get(key):
+            if key == 5:
+                started.set()
+                release.wait(5)
+            return get(key)
+
+        with mock.patch.object(self.memoize.backend, "get", side_effect=slow_get):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(self.square, 5)
+                started.wait(5)
+                self.assertEqual(self.square(3), 9)
+                self.assertFalse(future.done())
+                release.set()
+                self.assertEqual(future.result(), 25)
+
+    def test_exception_is_shared_and_not_cached(self):
+        """Test that an exception is raised to the caller and the key is computed again next time"""
+
+        @self.memoize
+        def fail(value):
+            self.calls.append(value)
+            raise ValueError(value)
+
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                fail(1)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_clear_during_computation(self):
+        """Test that a result computed across a clear is not stored"""
+
+        @self.memoize
+        def cleared(value):
+            self.calls.append(value)
+            self.memoize.clear_all_cache()
+            return value
+
+        cleared(1)
+        cleared(1)
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(self.memoize.usage()["items"], 0)
+
+    def test_invalidate(self):
+        """Test that only the items matching the tags, and items without tags, are invalidated"""
+
+        @self.memoize(tags=lambda result, value: {"even": value % 2 == 0})
+        def tagged(value):
+            self.calls.append(value)
+            return value
+
+        tagged(1)
+        tagged(2)
+        self.memoize.invalidate(lambda tags: tags["even"])
+        self.assertEqual(self.memoize.backend.keys(), [1])
+
+        # An item without tags is always invalidated
+        self.square(3)
+        self.memoize.invalidate(lambda tags: False)
+        self.assertEqual(self.memoize.backend.keys(), [1])
+
+    def test_max_bytes(self):
+        """Test that the least recently used items are purged until the cache fits max_bytes"""
+        memoize = Memoize(ttl=10, max_items=10, max_bytes=3 * approximate_size(["x" * 100]))
+
+        @memoize
+        def text(value):
+            return [value * 100]
+
+        for value in "abc":
+            text(value)
+        self.assertEqual(memoize.usage()["items"], 3)
+        text("d")
+        self.assertEqual(memoize.backend.keys(), ["b", "c", "d"])
+        self.assertLessEqual(memoize.usage()["bytes"], memoize.usage()["max_bytes"])
+
+        # An item larger than the budget is not cached, and doesn't push the others out
+        text("e" * 10)
+        self.assertEqual(memoize.backend.keys(), ["b", "c", "d"])
+
+        memoize.invalidate(lambda tags: True)
+        self.assertEqual(memoize.usage()["bytes"], 0)
+
+    def test_approximate_size(self):
+        """Test that shared objects are counted once and containers include their contents"""
+        value = "x" * 1000
+        self.assertGreater(approximate_size([value]), 1000)
+        self.assertLess(approximate_size([value, value]), 2000)
+
+
+class SQLiteMemoizeTestCase(MemoizeTestCase):
+    """Tests for Memoize with the SQLite backend, shared between processes"""
+
+    def create_memoize(self):
+        """Create a Memoize instance with a SQLite backend in a temporary directory"""
+        return Memoize(ttl=10, backend=SQLiteBackend(self.path, max_items=2))
+
+    def setUp(self):
+        """Setup a temporary database, and mark every hit as used (see: TOUCH_INTERVAL)"""
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "memoize.db")
+        patcher = mock.patch("generic_helpers.memoize_backends.TOUCH_INTERVAL", -1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def test_shared(self):
+        """Test that items and invalidations are shared by the instances using the same database"""
+        other = self.create_memoize()
+        other_calls = []
+
+        @other
+        def other_square(value):
+            other_calls.append(value)
+            return value * value
+
+        # Computed by one instance, a hit for the other
+        self.square(3)
+        self.assertEqual(other_square(3), 9)
+        self.assertEqual(other_calls, [])
+
+        # Invalidated by the other instance, computed again
+        other.invalidate(lambda tags: True)
+        self.square(3)
+        self.assertEqual(self.calls, [3, 3])
+
+    def test_invalidated_by_other_during_computation(self):
+        """Test that a result computed across an invalidation by another instance is not stored"""
+        other = self.create_memoize()
+
+        @self.memoize
+        def invalidated(value):
+            other.clear_all_cache()
+            return value
+
+        invalidated(1)
+        self.assertEqual(self.memoize.usage()["items"], 0)
+
+    def test_tags_stored_once(self):
+        """Test that items with the same tags share them, and that an invalidation matches every tags once"""
+        backend = SQLiteBackend(self.path, max_items=10)
+        backend.set("a", 1, 10, tags={"ids": frozenset([1])})
+        backend.set("b", 2, 10, tags={"ids": frozenset([1])})
+        backend.set("c", 3, 10, tags={"ids": frozenset([2])})
+        backend.set("d", 4, 10)
+        matched = []
+
+        def match(tags):
+            matched.append(tags)
+            return 1 in tags["ids"]
+
+        backend.invalidate(match)
+        self.assertEqual(len(matched), 2)
+        self.assertEqual(backend.keys(), ["c"])
+        self.assertEqual(backend.entry("c")[1], {"ids": frozenset([2])})
+        (count,) = backend._connection().execute("SELECT COUNT(*) FROM memoize_tags").fetchone()  # pylint: disable=protected-access
+        self.assertEqual(count, 1)
+
+    def test_stats(self):
+        """Test the counters of the instance and per function"""
+        self.memoize.reset_stats()
+        self.square(1)
+        self.square(1)
+        self.square(2)
+        self.square(3)
+        stats = self.memoize.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["computations"]), (1, 3, 3))
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.25)
+        (counters,) = stats["functions"].values()
+        self.assertEqual(counters["hits"], 1)
+        self.assertGreaterEqual(counters["time_saved"], 0)
+
+    def test_stale_while_revalidate(self):
+        """Test that a stale result is served while it's refreshed in the background"""
+        values = iter([1, 2])
+        entered = []
+
+        class Context:  # pylint: disable=too-few-public-methods
+            """Context manager recording it's entered by the refresh"""
+
+            def __enter__(self):
+                entered.append(threading.current_thread())
+
+            def __exit__(self, *args):
+                return False
+
+        @self.memoize(stale_ttl=10, context=Context)
+        def counter(key):  # pylint: disable=unused-argument
+            return next(values)
+
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=1000):
+            self.assertEqual(counter("key"), 1)
+
+        # Stale: the old result is returned, and computed again in the background
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=1015):
+            self.assertEqual(counter("key"), 1)
+            wait_for_computations(self.memoize, 2)
+            self.assertEqual(counter("key"), 2)
+        self.assertEqual(len(entered), 1)
+        self.assertIsNot(entered[0], threading.current_thread())
+
+        # Expired beyond the grace period (and refresh): computed by the caller
+        with mock.patch("generic_helpers.memoize_backends.time.time", return_value=1040):
+            with self.assertRaises(StopIteration):
+                counter("key")
+        stats = self.memoize.stats()
+        self.assertEqual((stats["stale_hits"], stats["refreshes"]), (1, 1))
+
+    def test_admission(self):
+        """Test that a full cache only admits a key which is used more often than the victim"""
+        memoize = self.create_memoize()
+        memoize.admission = FrequencySketch(width=64)
+
+        @memoize
+        def identity(value):
+            return value
+
+        # Fill the cache with two frequently used keys
+        for _ in range(3):
+            identity(1)
+            identity(2)
+
+        # A one-off key is returned but not stored, a key used more often displaces the victim
+        self.assertEqual(identity(3), 3)
+        self.assertEqual(memoize.backend.keys(), [1, 2])
+        for _ in range(5):
+            identity(4)
+        self.assertEqual(memoize.backend.keys(), [2, 4])
+        self.assertGreater(memoize.stats()["rejections"], 0)
+
+    def test_compression(self):
+        """Test that large results are stored compressed, and returned decoded on a hit"""
+        memoize = self.create_memoize()
+        memoize.codec = ZlibCodec(threshold=1024)
+
+        @memoize
+        def tasks(count):
+            return [{"title": f"Task {i}", "description": "Buy groceries " * 10} for i in range(count)]
+
+        # A small result is stored as is, a large result compressed
+        self.assertEqual(tasks(1), tasks(1))
+        self.assertEqual(tasks(100), tasks(100))
+        self.assertNotIsInstance(memoize.backend.get(1)[1], Compressed)
+        self.assertIsInstance(memoize.backend.get(100)[1], Compressed)
+
+        # The hit returns a copy, changing it doesn't change the cached result
+        tasks(100)[0]["title"] = "Changed"
+        self.assertEqual(tasks(100)[0]["title"], "Task 0")
+
+        stats = memoize.stats()
+        self.assertEqual(stats["compressions"], 1)
+        self.assertEqual(stats["decompressions"], 3)
+        self.assertLess(stats["compressed_bytes"], stats["raw_bytes"])
+        self.assertGreater(stats["decode_time"], 0)
+
+
+class TieredMemoizeTestCase(SQLiteMemoizeTestCase):
+    """Tests for Memoize with a memory tier in front of a SQLite tier"""
+
+    def create_memoize(self):
+        """Create a Memoize instance with a memory and a SQLite tier"""
+        return Memoize(
+            ttl=10,
+            backend=TieredBackend(MemoryBackend(max_items=2), SQLiteBackend(self.path, max_items=10)),
+        )
+
+    def test_read_through_after_restart(self):
+        """Test that a new instance (e.g. after a restart) reads the items from the disk tier"""
+        self.square(3)
+        restarted = self.create_memoize()
+
+        @restarted
+        def square(value):
+            self.calls.append(value)
+            return value * value
+
+        self.assertEqual(restarted.backend.keys(), [])
+        self.assertEqual(square(3), 9)
+        self.assertEqual(self.calls, [3])
+        self.assertEqual(restarted.backend.keys(), [3])
+        self.assertEqual(restarted.usage()["l2"]["hits"], 1)
+
+    def test_evicted_from_memory_tier(self):
+        """Test that an item evicted from the memory tier is still a hit from the disk tier"""
+        for value in [1, 2, 3]:
+            self.square(value)
+        self.assertEqual(self.memoize.backend.keys(), [2, 3])
+        self.square(1)
+        self.assertEqual(self.calls, [1, 2, 3])
+
+    def test_own_invalidation_keeps_memory_tier(self):
+        """Test that an invalidation by this instance doesn't clear the memory tier"""
+        tagged = self.memoize(tags=lambda result, value: value)(lambda value: value)
+        tagged(1)
+        tagged(2)
+        self.memoize.invalidate(lambda tags: tags == 2)
+        self.assertEqual(self.memoize.backend.keys(), [1])
+        tagged(1)
+        self.assertEqual(self.memoize.usage()["l2"]["hits"], 0)
+
+    def test_rejected_by_disk_tier_not_in_memory_tier(self):
+        """Test that an item the disk tier rejects (another instance invalidated) isn't kept in memory"""
+        backend = self.memoize.backend
+        other = self.create_memoize()
+        set_l2 = backend.l2.set
+
+        def invalidated_set(*args, **kwargs):
+            other.invalidate(lambda tags: True)
+            return set_l2(*args, **kwargs)
+
+        with mock.patch.object(backend.l2, "set", side_effect=invalidated_set):
+            backend.set(1, 1, 10, generation=backend.generation())
+        self.assertEqual(backend.keys(), [])
+        self.assertEqual(backend.l2.keys(), [])
@@ -0,0 +1,43 @@
+""" Unit tests for the pagination helpers """
+import unittest
+from datetime import datetime, timedelta
+from generic_helpers.pagination import datetime_sort_value, set_keyset_sorted_response
+
+
+class PaginationTestCase(unittest.TestCase):
+    """Tests for the pagination helpers"""
+
+    def test_datetime_sort_value(self):
+        """Test that the sort value keeps the order of datetimes, including microseconds"""
+        now = datetime(2023, 1, 1, 12)
+        values = [now, now + timedelta(microseconds=1), now - timedelta(days=400)]
+        self.assertEqual(
+            sorted(values, key=datetime_sort_value), sorted(values)
+        )
+        self.assertEqual(
+            sorted(values, key=lambda value: -datetime_sort_value(value)),
+            sorted(values, reverse=True),
+        )
+
+    def test_keyset_sorted_response(self):
+        """Test walking ids by cursor, ordered on (datetime, id) in both directions, ties on id"""
+        day = datetime(2023, 1, 1)
+        due_dates = {1: day, 2: day + timedelta(days=1), 3: day, 4: day + timedelta(days=2), 5: day}
+        for descending in [False, True]:
+            # In memory the ids are ordered on the datetime only, ties in any order (e.g. best match)
+            ids = sorted(due_dates, key=lambda item_id: (due_dates[item_id], -item_id), reverse=descending)
+            sort_values = [
+                -datetime_sort_value(due_dates[item_id]) if descending else datetime_sort_value(due_dates[item_id])
+                for item_id in ids
+            ]
+
+            walked = []
+            cursor = ""
+            while cursor is not None:
+                response = set_keyset_sorted_response(
+                    ids, sort_values, cursor=cursor, page_size=2, descending=descending
+                )
+                self.assertLessEqual(len(response["result"]), 2)
+                walked.extend(response["result"])
+                cursor = response["next_cursor"]
+            self.assertEqual(walked, [4, 2, 1, 3, 5] if descending else [1, 3, 5, 2, 4])
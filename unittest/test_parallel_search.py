@@ -0,0 +1,66 @@
+""" Unit tests for the sharded, process parallel, title array """
+import unittest
+from Levenshtein import distance
+from generic_helpers import parallel_search
+from generic_helpers.parallel_search import ShardedTitleArray, encode_shard, decode_shard
+
+
+class ShardedTitleArrayTestCase(unittest.TestCase):
+    """Tests for ShardedTitleArray"""
+
+    def setUp(self):
+        """Setup an array with numbered titles, scored by two worker processes"""
+
+        # Always fan out, also for this small amount of titles
+        self.original_min_parallel_size = parallel_search.MIN_PARALLEL_SIZE
+        parallel_search.MIN_PARALLEL_SIZE = 0
+
+        self.titles = {key: f"Task {key} ✓" for key in range(100)}
+        self.array = ShardedTitleArray(workers=2)
+        for key, title in self.titles.items():
+            self.array.add(key, title)
+
+    def tearDown(self):
+        """Stop the worker processes"""
+        self.array.close()
+        parallel_search.MIN_PARALLEL_SIZE = self.original_min_parallel_size
+
+    def brute_force(self, query, max_distance):
+        """Search by comparing every title"""
+        return sorted(
+            (key, title.lower(), distance(query, title.lower()))
+            for key, title in self.titles.items()
+            if distance(query, title.lower()) <= max_distance
+        )
+
+    def test_encode_decode_shard(self):
+        """Test that a shard block decodes into the same strings"""
+        values = ["task 1", "", "groceries ✓"]
+        self.assertEqual(decode_shard(encode_shard(values)), values)
+        self.assertEqual(decode_shard(encode_shard([])), [])
+
+    def test_search_equals_brute_force(self):
+        """Test that the merged results of all shards are the matches, also after writes"""
+        self.assertEqual(
+            sorted(self.array.search("task 42 ✓", 2)), self.brute_force("task 42 ✓", 2)
+        )
+
+        # Writes publish a new generation of shards on the next search
+        self.array.remove(42)
+        self.array.add(1, "Task 42 ✓")
+        del self.titles[42]
+        self.titles[1] = "Task 42 ✓"
+        self.assertEqual(
+            sorted(self.array.search("task 42 ✓", 2)), self.brute_force("task 42 ✓", 2)
+        )
+
+    def test_only_changed_shard_republished(self):
+        """Test that a write republishes the shard holding the changed title, not the others"""
+        self.array.search("task 1 ✓", 0)
+        names = [shard.name for shard in self.array.shards]
+
+        self.array.add(1, "Groceries")
+        self.assertEqual(self.array.search("groceries", 0), [(1, "groceries", 0)])
+        republished = [shard.name for shard in self.array.shards]
+        self.assertNotEqual(republished[0], names[0])
+        self.assertEqual(republished[1:], names[1:])
@@ -0,0 +1,51 @@
+""" Unit tests for the prefix index """
+import unittest
+from generic_helpers.prefix_index import PrefixIndex
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+    """Tests for PrefixIndex"""
+
+    def setUp(self):
+        """Setup an index with a few titles"""
+        self.index = PrefixIndex()
+        self.index.add(1, "Task 2")
+        self.index.add(2, "Task 1")
+        self.index.add(3, "Groceries")
+        self.index.add(4, "task 1")
+
+    def test_complete(self):
+        """Test that distinct values starting with the prefix (case-insensitive) are returned in order"""
+        self.assertEqual(self.index.complete("TA"), ["Task 1", "Task 2"])
+        self.assertEqual(self.index.complete("gro"), ["Groceries"])
+        self.assertEqual(self.index.complete("x"), [])
+
+    def test_limit(self):
+        """Test that no more than limit values are returned"""
+        self.assertEqual(self.index.complete("task", limit=1), ["Task 1"])
+
+    def test_replace_and_remove(self):
+        """Test that replaced and removed values are no longer completed"""
+        self.index.add(1, "Shopping")
+        self.index.remove(2)
+        self.index.remove(4)
+        self.index.remove(5)
+        self.assertEqual(self.index.complete("task"), [])
+        self.assertEqual(self.index.complete("sh"), ["Shopping"])
+        self.assertEqual(len(self.index), 2)
+
+    def test_none_rejected(self):
+        """Test that a key can't be added without a value, and keeps its previous value"""
+        with self.assertRaises(ValueError):
+            self.index.add(1, None)
+        self.assertEqual(self.index.complete("task 2"), ["Task 2"])
+
+    def test_duplicates_stored_once(self):
+        """Test that keys with the same (normalized) value share an entry, until the last one is removed"""
+        self.index.add(5, "TASK 1")
+        self.assertEqual(self.index.entries, ["groceries", "task 1", "task 2"])
+        self.index.remove(2)
+        self.assertEqual(self.index.complete("task 1"), ["task 1"])
+        self.index.remove(4)
+        self.index.remove(5)
+        self.assertEqual(self.index.entries, ["groceries", "task 2"])
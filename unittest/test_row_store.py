@@ -0,0 +1,99 @@
+""" Unit tests for the row store """
+import unittest
+from unittest import mock
+from generic_helpers.row_store import RowStore
+
+
+class RowStoreTestCase(unittest.TestCase):
+    """Tests for RowStore"""
+
+    def setUp(self):
+        """Setup a store which loads the rows from a dict, and remembers which ids it loaded"""
+        self.table = {item_id: {"id": item_id, "title": f"Task {item_id}"} for item_id in range(1, 6)}
+        self.loaded = []
+        self.generation = 0
+        self.rows = RowStore(self.load, generation=lambda: self.generation, max_items=3)
+
+    def load(self, ids):
+        """Load the rows of the ids from the table"""
+        self.loaded.extend(ids)
+        return {item_id: dict(self.table[item_id]) for item_id in ids if item_id in self.table}
+
+    def test_get_rows(self):
+        """Test that rows are returned in order of the ids, unknown ids are left out"""
+        self.assertEqual(
+            [row["id"] for row in self.rows.get_rows([3, 1, 99, 2])],
+            [3, 1, 2],
+        )
+
+    def test_rows_are_shared(self):
+        """Test that a row is loaded once, and shared by every lookup"""
+        first = self.rows.get_rows([1, 2])
+        second = self.rows.get_rows([2, 1])
+        self.assertEqual(self.loaded, [1, 2])
+        self.assertIs(first[0], second[1])
+        self.assertEqual(self.rows.usage()["hits"], 2)
+
+    def test_get_encoded(self):
+        """Test that the JSON encoding of a row is stored, and dropped together with the row"""
+        self.assertEqual(
+            self.rows.get_encoded([2, 99, 1]),
+            [b'{"id":2,"title":"Task 2"}', b'{"id":1,"title":"Task 1"}'],
+        )
+        self.assertIs(self.rows.get_encoded([1])[0], self.rows.get_encoded([1])[0])
+        self.table[1]["title"] = "Changed"
+        self.rows.discard(1)
+        self.assertEqual(self.rows.get_encoded([1]), [b'{"id":1,"title":"Changed"}'])
+
+    def test_least_recently_used_is_purged(self):
+        """Test that the store holds at most max_items rows"""
+        self.rows.get_rows([1, 2, 3])
+        self.rows.get_rows([1, 4])
+        self.assertEqual(len(self.rows), 3)
+        self.assertEqual(list(self.rows.rows), [3, 1, 4])
+
+    def test_discard(self):
+        """Test that a discarded row is loaded again"""
+        self.rows.get_rows([1, 2])
+        self.table[1]["title"] = "Changed"
+        self.rows.discard(1)
+        self.assertEqual(self.rows.get_rows([1])[0]["title"], "Changed")
+        self.assertEqual(self.loaded, [1, 2, 1])
+
+    def test_discard_during_load(self):
+        """Test that a row loaded while an item was changed is returned, but not stored"""
+
+        def load(ids):
+            # A writer changes an item while the rows are loaded
+            rows = self.load(ids)
+            self.rows.discard(ids[0])
+            return rows
+
+        self.rows.load = load
+        self.assertEqual(len(self.rows.get_rows([1, 2])), 2)
+        self.assertEqual(len(self.rows), 0)
+
+    def test_generation(self):
+        """Test that the rows are cleared when the generation changed in another process, but not
+        when the change was followed by a discard (of the item this process changed)
+        """
+        self.rows.get_rows([1, 2])
+        self.generation += 1
+        self.rows.discard(1)
+        self.assertEqual(len(self.rows), 1)
+
+        self.generation += 1
+        self.rows.get_rows([2])
+        self.assertEqual(self.loaded, [1, 2, 2])
+
+    def test_expiry(self):
+        """Test that a row is loaded again ttl seconds after it was loaded"""
+        self.rows.ttl = 10
+        with mock.patch("generic_helpers.row_store.time.time", return_value=1000):
+            self.rows.get_encoded([1])
+        self.table[1]["title"] = "Changed elsewhere"
+        with mock.patch("generic_helpers.row_store.time.time", return_value=1010):
+            self.assertEqual(self.rows.get_rows([1])[0]["title"], "Task 1")
+        with mock.patch("generic_helpers.row_store.time.time", return_value=1011):
+            self.assertEqual(self.rows.get_encoded([1]), [b'{"id":1,"title":"Changed elsewhere"}'])
+        self.assertEqual(self.loaded, [1, 1])
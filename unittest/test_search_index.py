@@ -0,0 +1,116 @@
+""" Unit tests for the search index """
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import unittest.mock
+from datetime import datetime
+from flask import Flask
+from models.task_model import Task, TaskStatus
+from database import db
+from generic_helpers.change_log import read_changes
+from generic_helpers.search_index import SearchIndex
+from generic_helpers import change_log
+
+# Runs in another process: adds a task and renames task 1, without telling this process
+OTHER_PROCESS = """
+import sqlite3
+import sys
+
+with sqlite3.connect(sys.argv[1]) as connection:
+    connection.execute(
+        "INSERT INTO tasks (title, description, status, due_date) "
+        "VALUES ('Task 2', 'Description', 'PENDING', '2030-01-01 00:00:00.000000')"
+    )
+    connection.execute("UPDATE tasks SET title = 'Done 1' WHERE id = 1")
+"""
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    """Tests for SearchIndex, with the database written by other processes"""
+
+    def setUp(self):
+        """Setup a database in a temporary directory, with one task"""
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.database_path = os.path.join(directory.name, "tasks.db")
+
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.database_path}"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Task(title="Task 1", status=TaskStatus.PENDING, due_date=datetime(2030, 1, 1)))
+            db.session.commit()
+
+        self.search_index = SearchIndex(Task, "title", attributes=("status",))
+        self.addCleanup(self.search_index.reset)
+
+    def write_in_other_process(self):
+        """Add a task and rename task 1 from another process"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, "-c", OTHER_PROCESS, self.database_path], cwd=root, check=True)
+
+    def test_write_in_other_process_applied(self):
+        """Test that the changes of another process are applied to the index, without rebuilding it"""
+        with self.app.app_context():
+            index = self.search_index.get_index("prefix")
+            self.assertEqual(index.complete("task"), ["Task 1"])
+            self.write_in_other_process()
+            self.assertIs(self.search_index.get_index("prefix"), index)
+            self.assertEqual(index.complete("task"), ["Task 2"])
+            self.assertEqual(index.complete("done"), ["Done 1"])
+            self.assertEqual(sorted(self.search_index.get_records([1, 2])), [1, 2])
+
+    def test_pool_kept_after_write_in_other_process(self):
+        """Test that the worker processes of the 'parallel' index are kept when another process wrote"""
+        with self.app.app_context():
+            index = self.search_index.get_index("parallel", workers=2)
+            index.pool = pool = object()
+            self.write_in_other_process()
+            self.assertIs(self.search_index.get_index("parallel"), index)
+            self.assertIs(index.pool, pool)
+            index.pool = None
+
+    def test_own_write_applied(self):
+        """Test that a write applied by this process is in the index, and not applied again"""
+        with self.app.app_context():
+            index = self.search_index.get_index("prefix")
+            task = Task(title="Task 3", status=TaskStatus.PENDING, due_date=datetime(2030, 1, 1))
+            db.session.add(task)
+            db.session.commit()
+            self.search_index.apply(task)
+            self.assertEqual(index.complete("task"), ["Task 1", "Task 3"])
+
+            # The change is read from the log, the record is already up to date
+            with unittest.mock.patch.object(self.search_index, "_apply") as apply:
+                self.assertIs(self.search_index.get_index("prefix"), index)
+            apply.assert_not_called()
+            self.assertEqual(self.search_index.last_change, 1)
+
+    def test_delete_applied(self):
+        """Test that a deleted task is removed from the index"""
+        with self.app.app_context():
+            index = self.search_index.get_index("prefix")
+            db.session.delete(db.session.get(Task, 1))
+            db.session.commit()
+            self.assertEqual(self.search_index.get_records([1]), {})
+            self.assertEqual(index.complete("task"), [])
+
+    def test_reloaded_after_log_trimmed(self):
+        """Test that all records are loaded again when the log no longer holds the changes since the last one seen"""
+        with self.app.app_context():
+            index = self.search_index.get_index("prefix")
+            with unittest.mock.patch.object(change_log, "CHANGE_LOG_SIZE", 1):
+                # The triggers hold the size they were created with, create them again
+                for suffix in ("ai", "ad", "au"):
+                    db.session.execute(db.text(f"DROP TRIGGER tasks_changes_{suffix}"))
+                change_log.create_change_log(Task)
+            self.write_in_other_process()
+            self.assertEqual(read_changes(Task, 0), [(2, 1)])
+            self.assertEqual(sorted(self.search_index.get_records([1, 2])), [1, 2])
+            self.assertIs(self.search_index.get_index("prefix"), index)
+            self.assertEqual(index.complete("done"), ["Done 1"])
+            self.assertEqual(self.search_index.last_change, 2)
@@ -0,0 +1,59 @@
+""" Unit tests for the title array """
+import unittest
+from unittest import mock
+from Levenshtein import distance
+from generic_helpers import title_array
+from generic_helpers.title_array import TitleArray
+
+
+class TitleArrayTestCase(unittest.TestCase):
+    """Tests for TitleArray"""
+
+    def setUp(self):
+        """Setup an array with numbered titles"""
+        self.titles = {key: f"Task {key}" for key in range(100)}
+        self.array = TitleArray()
+        for key, title in self.titles.items():
+            self.array.add(key, title)
+
+    def brute_force(self, query, max_distance):
+        """Search by comparing every title"""
+        return sorted(
+            (key, title.lower(), distance(query, title.lower()))
+            for key, title in self.titles.items()
+            if distance(query, title.lower()) <= max_distance
+        )
+
+    def test_search_equals_brute_force(self):
+        """Test that batched scoring with a cutoff finds the same matches"""
+        for query in ["task 1", "task 42", "tas"]:
+            for max_distance in range(0, 4):
+                self.assertEqual(
+                    sorted(self.array.search(query, max_distance)),
+                    self.brute_force(query, max_distance),
+                )
+
+    def test_replace_and_remove(self):
+        """Test that replaced and removed values are no longer found"""
+        self.array.add(1, "Shopping")
+        self.array.remove(2)
+        self.array.remove(99)
+        self.assertEqual(self.array.search("task 1", 0), [])
+        self.assertEqual(self.array.search("task 2", 0), [])
+        self.assertEqual(self.array.search("shopping", 0), [(1, "shopping", 0)])
+        self.assertEqual(self.array.search("task 98", 0), [(98, "task 98", 0)])
+        self.assertEqual(len(self.array), 98)
+
+    def test_search_while_writing(self):
+        """Test that a search scores a snapshot, writes during the scoring don't change its result"""
+        original_extract = title_array.process.extract
+
+        def extract(*args, **kwargs):
+            # A writer removes and replaces values while the search is scoring
+            self.array.remove(1)
+            self.array.add(2, "Shopping")
+            return original_extract(*args, **kwargs)
+
+        with mock.patch.object(title_array.process, "extract", side_effect=extract):
+            self.assertEqual(sorted(self.array.search("task 1", 0)), [(1, "task 1", 0)])
+        self.assertEqual(self.array.search("task 1", 0), [])
@@ -0,0 +1,42 @@
+""" Unit tests for the trigram index """
+import unittest
+from generic_helpers.trigram_index import TrigramIndex, trigrams
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+    """Tests for TrigramIndex"""
+
+    def setUp(self):
+        """Setup an index with a few titles"""
+        self.index = TrigramIndex()
+        self.index.add(1, "Task 1")
+        self.index.add(2, "Task 2")
+        self.index.add(3, "Groceries")
+
+    def test_trigrams(self):
+        """Test that a value is split in all its trigrams"""
+        self.assertEqual(trigrams("task"), {"tas", "ask"})
+        self.assertEqual(trigrams("ta"), set())
+
+    def test_search_substring(self):
+        """Test that only values containing the query (case-insensitive) are returned"""
+        self.assertEqual(self.index.search_substring("K 2"), [(2, "task 2")])
+        self.assertEqual(sorted(self.index.search_substring("task")), [(1, "task 1"), (2, "task 2")])
+
+    def test_search_requires_adjacent_trigrams(self):
+        """Test that having all trigrams in the wrong order is not a match"""
+        self.index.add(4, "ask tas")
+        self.assertIn(4, self.index.candidates("task"))
+        self.assertNotIn(4, [key for key, _ in self.index.search_substring("task")])
+
+    def test_short_query(self):
+        """Test that queries shorter than a trigram are not answered"""
+        self.assertEqual(self.index.search_substring("ta"), [])
+
+    def test_replace_and_remove(self):
+        """Test that replaced and removed values are no longer found"""
+        self.index.add(1, "Shopping")
+        self.index.remove(2)
+        self.assertEqual(self.index.search_substring("task"), [])
+        self.assertEqual(self.index.search_substring("shop"), [(1, "shopping")])
+        self.assertNotIn("tas", self.index.postings)